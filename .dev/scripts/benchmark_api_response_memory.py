@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+"""
+Compare the memory held by an api_call response before and after switching from the per-call
+ResponseDict class to ApiResponse, measured with tracemalloc on a large list and a large object response.
+
+Responses are measured through the real request path of api_call, including the GET request coalescing
+and its dedup window, with only the HTTP connection replaced by an in-memory response. The ResponseDict
+variant is built from the body returned by the same request path.
+
+The collection must be importable as ansible_collections.pcg.alpaca_operator, e.g. installed
+with 'ansible-galaxy collection install .' or checked out below ansible_collections/pcg/alpaca_operator.
+
+Usage: python3 .dev/scripts/benchmark_api_response_memory.py [AGENT_COUNT]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import gc
+import io
+import json
+import sys
+import tracemalloc
+
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils import _alpaca_api
+
+API_URL = 'http://alpaca.invalid:8443/api'
+
+__metaclass__ = type
+
+
+def response_dict(status_code, content):
+    """The response handling of api_call before ApiResponse, kept here for comparison"""
+    text = content.decode('utf-8') if isinstance(content, bytes) else content
+    try:
+        json_result = json.loads(text) if text else {}
+    except ValueError:
+        json_result = {}
+
+    class ResponseDict(dict):
+        def __init__(self, status_code, text, json_data):
+            if isinstance(json_data, dict):
+                super(ResponseDict, self).__init__(json_data)
+            else:
+                super(ResponseDict, self).__init__()
+            self._status_code = status_code
+            self._text = text
+            self._json_data = json_data
+
+        def json(self):
+            return self._json_data
+
+    return ResponseDict(status_code, text, json_result)
+
+
+class InMemoryResponse(io.BytesIO):
+    headers = {}
+
+
+def serve(content):
+    """Answer every request of api_call with a fresh copy of content instead of sending it to the API"""
+    def open_response(method, url, headers, data, verify):
+        return 200, InMemoryResponse(bytes(bytearray(content))), lambda complete: None
+    _alpaca_api._open_response = open_response
+
+
+def legacy_call(url):
+    """Send the request through the request path of api_call and build a ResponseDict from the body"""
+    status_code, content = _alpaca_api._request("GET", url, {}, None, True)
+    return response_dict(status_code, content)
+
+
+def api_call(url):
+    return _alpaca_api.api_call("GET", url)
+
+
+def measure(call, content, dedup_window):
+    """Return (retained, peak) bytes allocated while requesting content and reading its JSON"""
+    serve(content)
+    _alpaca_api._flights.clear()
+    _alpaca_api._dedup_windows[API_URL] = dedup_window
+    gc.collect()
+    tracemalloc.start()
+    response = call("{0}/agents".format(API_URL))
+    response.json()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del response
+    _alpaca_api._flights.clear()
+    return retained, peak
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    agents = [{"id": number, "hostname": "agent{0:05d}".format(number), "description": "Agent {0}".format(number), "ipAddress": "10.0.0.1",
+               "location": "virtual", "scriptGroupId": -1, "escalation": {"failuresBeforeReport": 0, "mailEnabled": False, "smsEnabled": False}}
+              for number in range(count)]
+    bodies = [
+        ("list of {0} agents".format(count), json.dumps(agents).encode('utf-8')),
+        ("object with {0} agents".format(count), json.dumps(dict(("agent{0:05d}".format(agent['id']), agent) for agent in agents)).encode('utf-8')),
+    ]
+    del agents
+
+    variants = [
+        ('ResponseDict MB', legacy_call, _alpaca_api.DEDUP_WINDOW),
+        ('ApiResponse MB', api_call, _alpaca_api.DEDUP_WINDOW),
+        ('ApiResponse, window 5 MB', api_call, 5),
+    ]
+    print("{0:<28}{1:>10}".format('response', 'body MB') + "".join("{0:>28}".format(name) for name, call, window in variants))
+    for name, content in bodies:
+        results = [measure(call, content, window) for variant, call, window in variants]
+        print("{0:<28}{1:>10.1f}".format(name, len(content) / 1e6)
+              + "".join("{0:>28}".format("{0:.1f} (peak {1:.1f})".format(retained / 1e6, peak / 1e6)) for retained, peak in results))
+    print("Retained memory includes the body received from the connection and anything api_call keeps of it, e.g. for the dedup window.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+"""
+Count the API requests alpaca_command_set sends for typical edits of a command set,
+once per reconciliation strategy.
+
+Reads are the command list of the system plus one detail request per command that is updated or
+deleted. Matched commands whose list summary already has the desired configuration are not read again,
+so the detail reads depend on the strategy as well.
+
+The collection must be importable as ansible_collections.pcg.alpaca_operator, e.g. installed
+with 'ansible-galaxy collection install .' or checked out below ansible_collections/pcg/alpaca_operator.
+
+Usage: python3 .dev/scripts/benchmark_command_set_reconciliation.py [COMMAND_COUNT]
+"""
+
+from __future__ import (absolute_import, division, print_function)
+
+import sys
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules.alpaca_command_set import command_identity, plan_reconciliation
+
+__metaclass__ = type
+
+STRATEGIES = ['position', 'identity']
+
+
+def make_command(number):
+    return {'agentHostname': 'agent{0:02d}'.format(number % 4), 'name': 'command {0}'.format(number), 'processId': 10 + number % 7, 'parameters': str(number)}
+
+
+def edit_patterns(count):
+    base = [make_command(number) for number in range(count)]
+    renamed = [dict(command) for command in base]
+    renamed[count // 2]['name'] = 'renamed command'
+    changed = [dict(command) for command in base]
+    changed[count // 2]['parameters'] = 'changed'
+    swapped = list(base)
+    swapped[1], swapped[count - 2] = swapped[count - 2], swapped[1]
+    return base, [
+        ('unchanged', base),
+        ('append one', base + [make_command(count)]),
+        ('insert one at top', [make_command(count)] + base),
+        ('insert one in the middle', base[:count // 2] + [make_command(count)] + base[count // 2:]),
+        ('delete first', base[1:]),
+        ('delete one in the middle', base[:count // 2] + base[count // 2 + 1:]),
+        ('swap two', swapped),
+        ('reverse order', list(reversed(base))),
+        ('rename one', renamed),
+        ('change parameters of one', changed),
+    ]
+
+
+def count_requests(desired, existing, strategy):
+    """Return (GET, PUT, POST, DELETE) counts, the GET requests are the command list and the detail reads"""
+    matches, excess = plan_reconciliation([command_identity(command) for command in desired], existing, strategy)
+    updates = sum(1 for command, match in zip(desired, matches) if match is not None and command != existing[match])
+    creations = sum(1 for match in matches if match is None)
+    return 1 + updates + len(excess), updates, creations, len(excess)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    existing, patterns = edit_patterns(count)
+
+    print("{0} existing commands".format(count))
+    print("{0:<28}{1}".format('edit', ''.join('{0:>28}'.format(strategy + ' GET/PUT/POST/DEL') for strategy in STRATEGIES)))
+    for name, desired in patterns:
+        row = []
+        for strategy in STRATEGIES:
+            reads, updates, creations, deletions = count_requests(desired, existing, strategy)
+            row.append('{0:>5} = {1}/{2}/{3}/{4}'.format(reads + updates + creations + deletions, reads, updates, creations, deletions))
+        print("{0:<28}{1}".format(name, ''.join('{0:>28}'.format(cell) for cell in row)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules import alpaca_command
+from ansible_collections.pcg.alpaca_operator.plugins.plugin_utils._alpaca_action import AlpacaModuleAction
+
+
+class ActionModule(AlpacaModuleAction):
+    MODULE = alpaca_command
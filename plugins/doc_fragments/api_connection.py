@@ -12,20 +12,35 @@ class ModuleDocFragment(object):
 ---
 options:
     api_connection:
-        description: Connection details for accessing the ALPACA Operator API.
+        description: >
+            Connection details for accessing the ALPACA Operator API.
+            Required unless the task uses C(ansible_connection=ansible.netcommon.httpapi) with C(ansible_network_os=pcg.alpaca_operator.alpaca).
+            The persistent connection then provides protocol, host, port, tls_verify and the login, and the other options still apply.
         version_added: '2.0.0'
-        required: true
+        required: false
         type: dict
         suboptions:
             username:
-                description: Username for authentication against the ALPACA Operator API.
+                description: >
+                    Username for authentication against the ALPACA Operator API.
+                    Required unless O(api_connection.token) is provided.
                 version_added: '1.0.0'
-                required: true
+                required: false
                 type: str
             password:
-                description: Password for authentication against the ALPACA Operator API.
+                description: >
+                    Password for authentication against the ALPACA Operator API.
+                    Required together with O(api_connection.username).
                 version_added: '1.0.0'
-                required: true
+                required: false
+                type: str
+            token:
+                description: >
+                    Pre-issued bearer token, for example returned by M(pcg.alpaca_operator.alpaca_login), used instead of
+                    logging in on every module run. If O(api_connection.username) and O(api_connection.password) are
+                    provided as well, they are used to login again when the API rejects the token.
+                version_added: '2.2.0'
+                required: false
                 type: str
             protocol:
                 description: Protocol to use. Can be V(http) or V(https).
@@ -52,4 +67,152 @@ options:
                 required: false
                 default: true
                 type: bool
+            token_cache:
+                description: >
+                    Cache the authentication token in O(api_connection.token_cache_dir) and share it between forks and tasks
+                    instead of logging in on every module run. Cached tokens are keyed by protocol, host, port and username.
+                    A file lock ensures that only one process logs in while the others wait and reuse its token.
+                version_added: '2.2.0'
+                required: false
+                default: false
+                type: bool
+            token_cache_dir:
+                description: Directory of the token cache on the host executing the module. Only used if O(api_connection.token_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: ~/.ansible/tmp/alpaca_operator
+                type: path
+            token_cache_ttl:
+                description: >
+                    Lifetime of a cached token in seconds if the token does not carry an expiry claim.
+                    V(0) only reuses cached tokens that carry an expiry claim. Negative values are rejected.
+                    Only used if O(api_connection.token_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: 300
+                type: int
+            max_concurrency:
+                description: >
+                    Maximum number of API requests a module sends in parallel, for example when fetching the details of many commands.
+                    V(1) sends all requests one after another.
+                version_added: '2.2.0'
+                required: false
+                default: 4
+                type: int
+            response_cache:
+                description: >
+                    Cache GET responses in O(api_connection.response_cache_dir) and share them between forks, tasks and playbook runs.
+                    Responses with an ETag or Last-Modified header are revalidated with a conditional request
+                    and reused if the API answers 304 Not Modified.
+                    Responses without these headers are reused for O(api_connection.response_cache_ttl) seconds,
+                    so changes made outside of Ansible may be seen late.
+                    Any write through this collection drops the cached responses of the affected collections.
+                    Cached responses are keyed by URL only, so do not share a cache directory between users with different permissions.
+                version_added: '2.2.0'
+                required: false
+                default: false
+                type: bool
+            response_cache_dir:
+                description: Directory of the response cache on the host executing the module. Only used if O(api_connection.response_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: ~/.ansible/tmp/alpaca_operator/responses
+                type: path
+            response_cache_ttl:
+                description: >
+                    Number of seconds a cached response without ETag or Last-Modified header is used without asking the API.
+                    V(0) sends every request to the API and only reuses responses the API confirms with 304 Not Modified.
+                    Negative values are rejected.
+                    Only used if O(api_connection.response_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: 60
+                type: int
+            response_cache_size:
+                description: >
+                    Maximum size of all cached responses in MiB. The least recently used responses are evicted first.
+                    Only used if O(api_connection.response_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: 64
+                type: int
+            snapshot_cache:
+                description: >
+                    Store the agents, variables, systems, groups and process catalogues in the SQLite database
+                    O(api_connection.snapshot_cache_path) and share them between forks and tasks.
+                    The first fork downloads a catalogue while the others wait and then read single rows from the database.
+                    Any write through this collection invalidates the snapshots of the affected collections for all forks.
+                    Changes made outside of Ansible are seen after O(api_connection.snapshot_cache_ttl) seconds at the latest.
+                    Snapshots are keyed by URL only, so do not share a snapshot database between users with different permissions.
+                    Ignored if the Python C(sqlite3) module is not available on the host executing the module.
+                version_added: '2.2.0'
+                required: false
+                default: false
+                type: bool
+            snapshot_cache_path:
+                description: >
+                    Path of the snapshot database on the host executing the module, a local file system is required.
+                    Only used if O(api_connection.snapshot_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: ~/.ansible/tmp/alpaca_operator/snapshots.sqlite
+                type: path
+            snapshot_cache_ttl:
+                description: >
+                    Number of seconds a snapshot is used before the collection is downloaded again.
+                    V(0) downloads the collection again every time a module needs it.
+                    Negative values are rejected.
+                    Only used if O(api_connection.snapshot_cache) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: 60
+                type: int
+            local_proxy:
+                description: >
+                    Send all requests through a local proxy daemon listening on a Unix socket in O(api_connection.local_proxy_dir).
+                    The first module run starts the proxy, which logs in once and keeps a keep-alive connection pool to the API for all forks
+                    and tasks using the same API and credentials. Identical GET requests in flight at the same time are sent to the API only once,
+                    and at most O(api_connection.local_proxy_max_connections) requests are sent to the API in parallel.
+                    The proxy stops after O(api_connection.local_proxy_idle_timeout) seconds without requests.
+                    Request counters, including merged (hits) and upstream (misses) GET requests, are returned by C(GET /_proxy/stats) on the socket.
+                    Ignored on hosts without Unix sockets. If the proxy cannot be started, requests are sent to the API directly.
+                version_added: '2.2.0'
+                required: false
+                default: false
+                type: bool
+            local_proxy_dir:
+                description: >
+                    Directory of the local proxy sockets on the host executing the module. Keep the path short, as Unix socket paths are limited
+                    to about 100 characters. Only used if O(api_connection.local_proxy) is enabled.
+                version_added: '2.2.0'
+                required: false
+                default: ~/.ansible/tmp/alpaca_operator/proxy
+                type: path
+            local_proxy_idle_timeout:
+                description: >
+                    Number of seconds without requests after which the local proxy stops.
+                    Only used by the module run that starts the proxy.
+                version_added: '2.2.0'
+                required: false
+                default: 300
+                type: int
+            local_proxy_max_connections:
+                description: >
+                    Maximum number of requests the local proxy sends to the API in parallel, further requests wait for a free connection.
+                    Only used by the module run that starts the proxy.
+                version_added: '2.2.0'
+                required: false
+                default: 8
+                type: int
+            dedup_window:
+                description: >
+                    Number of seconds a successful GET response is reused for identical GET requests of the same module run.
+                    Identical GET requests in flight at the same time are always sent only once.
+                    Any write through the module drops the reused responses of the affected resources.
+                    V(0) only shares GET requests in flight at the same time.
+                    Every reused response is kept parsed in memory for the window, in addition to the copies returned to the module.
+                version_added: '2.2.0'
+                required: false
+                default: 0
+                type: int
 '''
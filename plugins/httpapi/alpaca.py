@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: alpaca
+short_description: HttpApi plugin for the ALPACA Operator REST API
+description:
+    - Persistent connection to the ALPACA Operator REST API, used with C(ansible_connection=ansible.netcommon.httpapi)
+      and C(ansible_network_os=pcg.alpaca_operator.alpaca).
+    - The persistent connection process logs in once with C(ansible_user) and C(ansible_password) and keeps the token and
+      the keep-alive connections to the API for the whole play. The modules of this collection send their requests through it,
+      so O(pcg.alpaca_operator.alpaca_agent#module:api_connection) may be omitted.
+    - The API is reached on C(ansible_host) and C(ansible_httpapi_port), default V(8443), with HTTPS if C(ansible_httpapi_use_ssl)
+      is enabled. C(ansible_httpapi_validate_certs) controls the certificate validation.
+    - A rejected token, for example after it expired, is renewed with a new login.
+version_added: '2.2.0'
+author:
+    - Jan-Karsten Hansmeyer (@pcg)
+'''
+
+from ansible.plugins.httpapi import HttpApiBase
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import (
+    _send_with_renewal,
+    get_api_url,
+    get_token,
+)
+
+DEFAULT_PORT = 8443
+
+# Response headers returned to the modules, used by the response cache
+RETURNED_RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class HttpApi(HttpApiBase):
+
+    def __init__(self, connection):
+        super(HttpApi, self).__init__(connection)
+        self._token = None
+
+    def get_api_settings(self):
+        """Return protocol, host, port and tls_verify of the API, they replace those of the api_connection module parameter"""
+        return dict(
+            protocol='https' if self.connection.get_option('use_ssl') else 'http',
+            host=self.connection.get_option('host'),
+            port=self.connection.get_option('port') or DEFAULT_PORT,
+            tls_verify=bool(self.connection.get_option('validate_certs')),
+        )
+
+    def _api_url(self):
+        return get_api_url(self.get_api_settings())
+
+    def login(self, username, password):
+        self._token = get_token(self._api_url(), username, password, self.get_api_settings()['tls_verify'])
+        self.connection._auth = {"Authorization": "Bearer {0}".format(self._token)}
+
+    def logout(self):
+        # The API has no logout endpoint, the token expires on its own
+        self._token = None
+
+    def send_request(self, method, path, data=None, headers=None):
+        """Send a request for a module and return (status_code, content, response_headers), content as text"""
+        if self._token is None:
+            self.login(self.connection.get_option('remote_user'), self.connection.get_option('password'))
+
+        settings = self.get_api_settings()
+        headers = dict(headers or {}, Authorization="Bearer {0}".format(self._token))
+        url = "{0}://{1}:{2}{3}".format(settings['protocol'], settings['host'], settings['port'], path)
+        status_code, content, response_headers = _send_with_renewal(method, url, headers, data.encode('utf-8') if data is not None else None,
+                                                                    settings['tls_verify'])
+        return status_code, content.decode('utf-8'), dict((name, response_headers.get(name)) for name in RETURNED_RESPONSE_HEADERS
+                                                          if response_headers.get(name))
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+name: alpaca
+short_description: ALPACA Operator inventory source
+description:
+    - Builds an inventory from the systems and agents registered in ALPACA Operator.
+    - Every system becomes a host named after the system and is added to C(alpaca_systems) and to the group of its ALPACA Operator group.
+    - Every agent becomes a host named after its hostname and is added to C(alpaca_agents).
+    - The configuration, agents and variables of all systems are fetched in parallel,
+      at most O(api_connection.max_concurrency) requests at a time.
+    - With O(cache) enabled, the inventory is stored in the configured inventory cache plugin and later runs
+      do not contact the API until O(cache_timeout) expires. Use C(ansible-inventory --flush-cache) to refresh it.
+    - The cache only holds the groups and the hosts with their variables, that is the general configuration, agent names
+      and variable values of every system and, with O(include_agents), the configuration of every agent as returned by the API.
+      System variables may contain credentials, so restrict access to the cache, for example the directory in O(cache_connection).
+    - Uses a YAML configuration file whose name ends with C(alpaca.yml) or C(alpaca.yaml).
+version_added: '2.2.0'
+author:
+    - Jan-Karsten Hansmeyer (@pcg)
+extends_documentation_fragment:
+    - constructed
+    - inventory_cache
+options:
+    plugin:
+        description: Token that ensures this is a source file for the plugin.
+        required: true
+        choices: ['pcg.alpaca_operator.alpaca']
+    api_connection:
+        description:
+            - Connection details for accessing the ALPACA Operator API.
+            - Same suboptions as in the modules, see O(pcg.alpaca_operator.alpaca_system#module:api_connection).
+        required: true
+        type: dict
+    include_agents:
+        description: Add the agents as hosts. Agents assigned to a system are listed in the C(alpaca_agents) variable of the system either way.
+        type: bool
+        default: true
+    include_variables:
+        description: Fetch the variables of every system into the C(alpaca_variables) variable of the system host.
+        type: bool
+        default: true
+'''
+
+EXAMPLES = r'''
+# alpaca.yml
+plugin: pcg.alpaca_operator.alpaca
+api_connection:
+  host: alpaca.example.com
+  port: 8443
+  protocol: https
+  username: secret
+  password: secret
+  tls_verify: true
+  max_concurrency: 16
+
+# Cache the inventory for an hour
+cache: true
+cache_plugin: ansible.builtin.jsonfile
+cache_connection: ~/.ansible/tmp/alpaca_inventory
+cache_timeout: 3600
+
+# Use the agent address and group the agents by location
+compose:
+  ansible_host: alpaca_agent.ipAddress | default(omit)
+keyed_groups:
+  - key: alpaca_agent.location
+    prefix: location
+    separator: '_'
+'''
+
+from ansible.errors import AnsibleParserError
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+from ansible.plugins.inventory import BaseInventoryPlugin, Cacheable, Constructable
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import (
+    api_get_concurrently,
+    get_api_connection_argument_spec,
+    get_api_url,
+    get_auth_headers,
+    get_negative_options,
+)
+
+
+class InventoryModule(BaseInventoryPlugin, Constructable, Cacheable):
+
+    NAME = 'pcg.alpaca_operator.alpaca'
+
+    def verify_file(self, path):
+        return super(InventoryModule, self).verify_file(path) and path.endswith(('alpaca.yml', 'alpaca.yaml'))
+
+    def _api_connection(self):
+        """Return the api_connection option with the defaults of the modules applied"""
+        result = ArgumentSpecValidator(dict(api_connection=get_api_connection_argument_spec())).validate(
+            dict(api_connection=self.get_option('api_connection')))
+        if result.error_messages:
+            raise AnsibleParserError("Invalid api_connection option: {0}".format(", ".join(result.error_messages)))
+        api_connection = result.validated_parameters['api_connection']
+        if not api_connection.get('username') and not api_connection.get('token'):
+            raise AnsibleParserError("one of the following is required: username, token found in api_connection")
+        negative = get_negative_options(api_connection)
+        if negative:
+            raise AnsibleParserError("api_connection options must not be negative: {0}".format(", ".join(negative)))
+        return api_connection
+
+    def _fetch(self):
+        """Fetch the groups, agents and systems and the configuration, agents and variables of every system"""
+        api_connection = self._api_connection()
+        api_url = get_api_url(api_connection)
+        verify = api_connection['tls_verify']
+        max_concurrency = api_connection['max_concurrency']
+        headers = get_auth_headers(api_url, api_connection)
+
+        subresources = ["", "/agents"] + (["/variables"] if self.get_option('include_variables') else [])
+        groups, agents, systems = self._get_all(["{0}/{1}".format(api_url, resource) for resource in ["groups", "agents", "systems"]],
+                                                headers, verify, max_concurrency)
+        details = self._get_all(["{0}/systems/{1}{2}".format(api_url, system['id'], subresource) for system in systems for subresource in subresources],
+                                headers, verify, max_concurrency)
+
+        for index, system in enumerate(systems):
+            system_details = dict(zip(subresources, details[index * len(subresources):(index + 1) * len(subresources)]))
+            system.update(system_details[""])
+            system['agents'] = system_details["/agents"] or []
+            system['variables'] = system_details.get("/variables") or []
+        return self._host_data(groups or [], agents or [], systems or [])
+
+    def _host_data(self, groups, agents, systems):
+        """Return the groups and the hosts with their variables, the only data populating the inventory and stored in the cache"""
+        return dict(
+            groups=[[group['id'], group['name']] for group in groups],
+            systems=[dict(name=system['name'], group_id=system.get('groupId'), variables=dict(
+                alpaca_id=system['id'],
+                alpaca_system=dict((key, value) for key, value in system.items() if key not in ('agents', 'variables')),
+                alpaca_agents=[agent.get('name') for agent in system['agents']],
+                alpaca_variables=dict((variable['name'], variable.get('value')) for variable in system['variables']),
+            )) for system in systems],
+            agents=[dict(name=agent['hostname'], variables=dict(alpaca_id=agent['id'], alpaca_agent=agent))
+                    for agent in agents] if self.get_option('include_agents') else [],
+        )
+
+    def _get_all(self, urls, headers, verify, max_concurrency):
+        results = []
+        for url, (result, error) in zip(urls, api_get_concurrently(urls, headers, verify, max_concurrency)):
+            if error:
+                raise AnsibleParserError("Failed to fetch {0}: {1}".format(url, str(error)))
+            results.append(result)
+        return results
+
+    def _add_host(self, name, group, variables):
+        strict = self.get_option('strict')
+        self.inventory.add_host(name, group=group)
+        for key, value in variables.items():
+            self.inventory.set_variable(name, key, value)
+        self._set_composite_vars(self.get_option('compose'), variables, name, strict=strict)
+        self._add_host_to_composed_groups(self.get_option('groups'), variables, name, strict=strict)
+        self._add_host_to_keyed_groups(self.get_option('keyed_groups'), variables, name, strict=strict)
+
+    def _populate(self, data):
+        group_names = dict((group_id, self._sanitize_group_name(name)) for group_id, name in data['groups'])
+        for group_name in ['alpaca_systems', 'alpaca_agents'] + list(group_names.values()):
+            self.inventory.add_group(group_name)
+
+        agent_systems = {}
+        for system in data['systems']:
+            for agent_name in system['variables']['alpaca_agents']:
+                agent_systems.setdefault(agent_name, []).append(system['name'])
+
+            self._add_host(system['name'], 'alpaca_systems', system['variables'])
+            if system['group_id'] in group_names:
+                self.inventory.add_child(group_names[system['group_id']], system['name'])
+
+        for agent in data['agents']:
+            self._add_host(agent['name'], 'alpaca_agents', dict(agent['variables'], alpaca_systems=agent_systems.get(agent['name'], [])))
+
+    def parse(self, inventory, loader, path, cache=True):
+        super(InventoryModule, self).parse(inventory, loader, path, cache)
+        self._read_config_data(path)
+
+        cache_key = self.get_cache_key(path)
+        use_cache = self.get_option('cache') and cache
+        update_cache = self.get_option('cache') and not cache
+
+        data = None
+        if use_cache:
+            try:
+                data = self._cache[cache_key]
+            except KeyError:
+                update_cache = True
+        if data is None:
+            data = self._fetch()
+        if update_cache:
+            self._cache[cache_key] = data
+
+        self._populate(data)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+
+# This module is for internal use only within the pcg.alpaca_operator collection.
+# Python versions supported: 3.8+
+
+# Agent payload and comparison shared by the alpaca_agent and alpaca_agents modules.
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+
+def build_payload(desired_agent_config, current_agent_config):
+    """
+    Constructs a configuration payload by prioritizing values from the desired configuration
+    dictionary. If a value is not provided in the desired configuration, the function falls
+    back to using the corresponding value from the existing configuration (if available).
+
+    Parameters:
+        desired_agent_config (dict): A dictionary containing the desired configuration values.
+        current_agent_config (dict): A dictionary with existing configuration values.
+
+    Returns:
+        dict: A combined configuration payload dictionary.
+    """
+
+    payload = {
+        "description":              desired_agent_config.get('description', None)                                           if desired_agent_config.get('description', None)                                            is not None else current_agent_config.get('description', ''),
+        "escalation": {
+            "failuresBeforeReport": (desired_agent_config.get('escalation') or {}).get('failures_before_report', None)     if (desired_agent_config.get('escalation') or {}).get('failures_before_report', None)      is not None else current_agent_config.get('escalation', {}).get('failuresBeforeReport', 0),
+            "mailAddress":          (desired_agent_config.get('escalation') or {}).get('mail_address', None)                if (desired_agent_config.get('escalation') or {}).get('mail_address', None)                 is not None else current_agent_config.get('escalation', {}).get('mailAddress', ''),
+            "mailEnabled":          (desired_agent_config.get('escalation') or {}).get('mail_enabled', None)                if (desired_agent_config.get('escalation') or {}).get('mail_enabled', None)                 is not None else current_agent_config.get('escalation', {}).get('mailEnabled', False),
+            "smsAddress":           (desired_agent_config.get('escalation') or {}).get('sms_address', None)                 if (desired_agent_config.get('escalation') or {}).get('sms_address', None)                  is not None else current_agent_config.get('escalation', {}).get('smsAddress', ''),
+            "smsEnabled":           (desired_agent_config.get('escalation') or {}).get('sms_enabled', None)                 if (desired_agent_config.get('escalation') or {}).get('sms_enabled', None)                  is not None else current_agent_config.get('escalation', {}).get('smsEnabled', False),
+        },
+        "hostname":                 desired_agent_config.get('new_name', None) or desired_agent_config.get('name', None)    if desired_agent_config.get('new_name', None) or desired_agent_config.get('name', None)     is not None else current_agent_config.get('hostname', ''),
+        "ipAddress":                desired_agent_config.get('ip_address', None)                                            if desired_agent_config.get('ip_address', None)                                             is not None else current_agent_config.get('ipAddress', ''),
+        "location":                 desired_agent_config.get('location', None)                                              if desired_agent_config.get('location', None)                                               is not None else current_agent_config.get('location', 'virtual'),
+        "scriptGroupId":            desired_agent_config.get('script_group_id', None)                                       if desired_agent_config.get('script_group_id', None)                                        is not None else current_agent_config.get('scriptGroupId', -1),
+    }
+
+    return payload
+
+
+def get_changes(agent_payload, current_agent_config):
+    """Return the differences between the payload and the current agent configuration, escalation settings are compared per key"""
+    diff = {}
+    for key in agent_payload:
+        if key not in ['escalation']:
+            if agent_payload.get(key, None) != current_agent_config.get(key, None):
+                diff[key] = {
+                    'current': current_agent_config.get(key, None),
+                    'desired': agent_payload.get(key, None)
+                }
+        if key in ['escalation']:
+            for sub_key in agent_payload.get(key, {}):
+                if agent_payload.get(key, {}).get(sub_key, None) != current_agent_config.get(key, {}).get(sub_key, None):
+                    if key not in diff:
+                        diff[key] = {}
+                    diff[key][sub_key] = {
+                        'current': current_agent_config.get(key, {}).get(sub_key, None),
+                        'desired': agent_payload.get(key, {}).get(sub_key, None)
+                    }
+    return diff
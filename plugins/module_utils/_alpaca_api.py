@@ -11,10 +11,588 @@ from __future__ import (absolute_import, division, print_function)
 
 __metaclass__ = type
 
+import base64
+import codecs
+import contextlib
+import copy
+import hashlib
 import json as json_module
+import os
+import re
+import socket
+import ssl
+import tempfile
+import threading
+import time
 
+from ansible.module_utils.connection import Connection, ConnectionError
+from ansible.module_utils.six import integer_types, string_types, text_type
+from ansible.module_utils.six.moves import http_client
+from ansible.module_utils.six.moves.urllib.error import HTTPError
+from ansible.module_utils.six.moves.urllib.parse import urljoin, urlsplit
+from ansible.module_utils.six.moves.urllib.request import getproxies, proxy_bypass
 from ansible.module_utils.urls import open_url
 
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+try:
+    from concurrent.futures import ThreadPoolExecutor
+    HAS_CONCURRENT_FUTURES = True
+except ImportError:
+    HAS_CONCURRENT_FUTURES = False
+
+try:
+    import sqlite3
+    HAS_SQLITE3 = True
+except ImportError:
+    HAS_SQLITE3 = False
+
+HTTP_AGENT = 'ansible-alpaca-operator'
+HTTP_TIMEOUT = 10
+MAX_IDLE_CONNECTIONS = 16
+TOKEN_CACHE_DIR = '~/.ansible/tmp/alpaca_operator'
+TOKEN_CACHE_TTL = 300
+TOKEN_EXPIRY_MARGIN = 30
+MAX_CONCURRENCY = 4
+RESPONSE_CACHE_DIR = '~/.ansible/tmp/alpaca_operator/responses'
+RESPONSE_CACHE_TTL = 60
+RESPONSE_CACHE_SIZE = 64
+SNAPSHOT_CACHE_PATH = '~/.ansible/tmp/alpaca_operator/snapshots.sqlite'
+SNAPSHOT_CACHE_TTL = 60
+LOCAL_PROXY_DIR = '~/.ansible/tmp/alpaca_operator/proxy'
+LOCAL_PROXY_IDLE_TIMEOUT = 300
+LOCAL_PROXY_MAX_CONNECTIONS = 8
+DEDUP_WINDOW = 0
+# api_connection options where 0 is a valid value and negative values are rejected
+NON_NEGATIVE_OPTIONS = ('token_cache_ttl', 'response_cache_ttl', 'snapshot_cache_ttl')
+STREAM_CHUNK_SIZE = 65536
+# Bytes of a collection read after a scan found all values, to keep the connection instead of opening a new one
+SCAN_DRAIN_LIMIT = 1024 * 1024
+# Redirects followed for GET and HEAD requests, like open_url does
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+LOCAL_PROXY_TIMEOUT = HTTP_TIMEOUT * 6
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS')
+
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_UNPARSED = object()
+
+# Item keys with a row index in the snapshot cache, mapped to their column
+SNAPSHOT_KEYS = {'id': 'id', 'name': 'name', 'hostname': 'hostname', 'globalId': 'global_id'}
+_SNAPSHOT_SCHEMA = '''
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS collections (url TEXT PRIMARY KEY, generation INTEGER NOT NULL, fetched REAL);
+CREATE TABLE IF NOT EXISTS items (
+    collection TEXT NOT NULL, position INTEGER NOT NULL, id TEXT, name TEXT, hostname TEXT, global_id TEXT, body TEXT NOT NULL,
+    PRIMARY KEY (collection, position));
+CREATE INDEX IF NOT EXISTS items_id ON items (collection, id);
+CREATE INDEX IF NOT EXISTS items_name ON items (collection, name);
+CREATE INDEX IF NOT EXISTS items_hostname ON items (collection, hostname);
+CREATE INDEX IF NOT EXISTS items_global_id ON items (collection, global_id);
+'''
+
+# Keep-alive connections of the current module run, keyed by (protocol, host, port, tls_verify)
+_idle_connections = {}
+_connection_lock = threading.Lock()
+
+# Credentials of the logins performed in the current module run, keyed by API URL, used to re-login on a 401
+_logins = {}
+# Tokens rejected by the API mapped to the token that replaced them
+_renewed_tokens = {}
+_auth_lock = threading.Lock()
+
+# Collections fetched in the current module run with their lookup indexes, keyed by collection URL
+_resource_indexes = {}
+_resource_items = {}
+_index_lock = threading.Lock()
+
+# On-disk response caches enabled for the current module run, keyed by API URL
+_response_caches = {}
+
+# SQLite snapshot caches enabled for the current module run, keyed by API URL
+_snapshot_stores = {}
+
+# Unix sockets of the local API proxies used in the current module run, keyed by API URL
+_local_proxies = {}
+
+# Persistent connections of the pcg.alpaca_operator.alpaca httpapi plugin, keyed by API URL
+_persistent_connections = {}
+
+# GET requests in flight or shared within the dedup window, keyed by (URL, token), and the dedup windows keyed by API URL
+_flights = {}
+_dedup_windows = {}
+_flight_lock = threading.Lock()
+
+
+class _UnixHTTPConnection(http_client.HTTPConnection):
+    """HTTP connection to the local API proxy over a Unix socket"""
+
+    def __init__(self, socket_path, timeout):
+        http_client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def _persistent_connection(url):
+    """Return the persistent httpapi connection used for the given URL, or None"""
+    for api_url, connection in _persistent_connections.items():
+        if url == api_url or url.startswith(api_url + '/'):
+            return connection
+    return None
+
+
+def _local_proxy(url):
+    """Return the socket of the local API proxy used for the given URL, or None"""
+    for api_url, socket_path in _local_proxies.items():
+        if url == api_url or url.startswith(api_url + '/'):
+            return socket_path
+    return None
+
+
+def _connection_key(url, verify):
+    """Return the pool key and request path for the given URL"""
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == 'https' else 80)
+    path = parts.path or '/'
+    if parts.query:
+        path = "{0}?{1}".format(path, parts.query)
+    socket_path = _local_proxy(url)
+    if socket_path:
+        return ('unix', socket_path, None, None), path
+    return (parts.scheme, parts.hostname, port, bool(verify)), path
+
+
+def _uses_proxy(url):
+    """Check whether the environment routes the given URL through a proxy"""
+    parts = urlsplit(url)
+    return parts.scheme in getproxies() and not proxy_bypass(parts.hostname)
+
+
+def _acquire_connection(key):
+    """Return an idle pooled connection for key or open a new one"""
+    with _connection_lock:
+        connections = _idle_connections.get(key)
+        if connections:
+            return connections.pop(), True
+
+    protocol, host, port, verify = key
+    if protocol == 'unix':
+        # The proxy may queue requests behind its upstream concurrency limit
+        return _UnixHTTPConnection(host, timeout=LOCAL_PROXY_TIMEOUT), False
+    if protocol == 'https':
+        context = ssl.create_default_context()
+        if not verify:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        return http_client.HTTPSConnection(host, port, timeout=HTTP_TIMEOUT, context=context), False
+    return http_client.HTTPConnection(host, port, timeout=HTTP_TIMEOUT), False
+
+
+def _release_connection(key, connection):
+    """Return a connection to the pool so that later requests can reuse it"""
+    with _connection_lock:
+        connections = _idle_connections.setdefault(key, [])
+        if len(connections) < MAX_IDLE_CONNECTIONS:
+            connections.append(connection)
+            return
+    connection.close()
+
+
+def close_connections():
+    """Close all pooled keep-alive connections"""
+    with _connection_lock:
+        for connections in _idle_connections.values():
+            for connection in connections:
+                connection.close()
+        _idle_connections.clear()
+
+
+def reset_run_state():
+    """
+    Close the pooled connections and forget the logins, collections, caches and shared GET requests of the module run.
+
+    Modules running in the controller process share this module between tasks and loop items, which must not see
+    the state of the previous run.
+    """
+    close_connections()
+    with _auth_lock:
+        _logins.clear()
+        _renewed_tokens.clear()
+    with _index_lock:
+        _resource_indexes.clear()
+        _resource_items.clear()
+    with _flight_lock:
+        _flights.clear()
+        _dedup_windows.clear()
+    _response_caches.clear()
+    _snapshot_stores.clear()
+    _local_proxies.clear()
+    _persistent_connections.clear()
+
+
+def _open_response(method, url, headers, data, verify, redirects=0):
+    """
+    Send a request over a pooled keep-alive connection and return (status_code, response, done) without reading the body.
+
+    done(complete) must be called when the caller is finished with the response: with complete=True once the body
+    was read completely, so the connection can be reused, or with complete=False to close the connection.
+    GET and HEAD requests follow up to MAX_REDIRECTS redirects like open_url, other requests return the redirect.
+    """
+    request_headers = {'User-Agent': HTTP_AGENT}
+    request_headers.update(headers or {})
+
+    # Honour proxy settings from the environment the same way open_url does, the local API proxy applies them itself
+    if not _local_proxy(url) and _uses_proxy(url):
+        try:
+            response = open_url(url, method=method, headers=request_headers, data=data, validate_certs=verify, http_agent=HTTP_AGENT)
+        except HTTPError as e:
+            return e.code, e, lambda complete: e.close()
+        return response.getcode(), response, lambda complete: response.close()
+
+    key, path = _connection_key(url, verify)
+    while True:
+        connection, reused = _acquire_connection(key)
+        sent = False
+        try:
+            connection.request(method, path, body=data, headers=request_headers)
+            sent = True
+            response = connection.getresponse()
+        except socket.timeout:
+            connection.close()
+            raise
+        except (http_client.HTTPException, socket.error):
+            connection.close()
+            # The server may have closed an idle keep-alive connection, retry once on a fresh one. Once the request
+            # was sent, the server may already have applied it, so only idempotent requests are sent again.
+            if reused and (not sent or method in IDEMPOTENT_METHODS):
+                continue
+            raise
+
+        def done(complete, connection=connection, response=response):
+            if complete and not response.will_close:
+                _release_connection(key, connection)
+            else:
+                connection.close()
+
+        location = response.getheader('Location') if response.status in REDIRECT_STATUS_CODES else None
+        if location and method in ('GET', 'HEAD') and redirects < MAX_REDIRECTS:
+            # The body of a redirect is a short notice, read it so the connection can be reused
+            response.read()
+            done(True)
+            return _open_response(method, urljoin(url, location), headers, data, verify, redirects + 1)
+        return response.status, response, done
+
+
+def _send_persistent(connection, method, url, headers, data):
+    """Send a request through the persistent connection of the pcg.alpaca_operator.alpaca httpapi plugin"""
+    parts = urlsplit(url)
+    path = "{0}?{1}".format(parts.path, parts.query) if parts.query else parts.path
+    # The httpapi plugin authenticates the request itself, only text can be passed to it
+    headers = dict((name, value) for name, value in (headers or {}).items() if name != 'Authorization')
+    status_code, content, response_headers = connection.send_request(method, path, data.decode('utf-8') if data is not None else None, headers)
+    return status_code, content.encode('utf-8'), response_headers
+
+
+def _send_request(method, url, headers, data, verify):
+    """Send a request over a pooled keep-alive connection and return (status_code, content, response_headers)"""
+    connection = _persistent_connection(url)
+    if connection is not None:
+        return _send_persistent(connection, method, url, headers, data)
+
+    status_code, response, done = _open_response(method, url, headers, data, verify)
+    try:
+        content = response.read()
+    except Exception:
+        done(False)
+        raise
+    done(True)
+    return status_code, content, response.headers
+
+
+def _send_with_renewal(method, url, headers, data, verify):
+    """Send a request and login again once if the API rejected a token obtained by get_token (e.g. expired or revoked)"""
+    headers = _current_headers(headers)
+    status_code, content, response_headers = _send_request(method, url, headers, data, verify)
+    if status_code == 401 and _renew_token(url, headers):
+        headers = _current_headers(headers)
+        status_code, content, response_headers = _send_request(method, url, headers, data, verify)
+    return status_code, content, response_headers
+
+
+def _drain(response, limit):
+    """Read and discard the rest of a response body up to limit bytes, return True if the body was read completely"""
+    drained = 0
+    while drained <= limit:
+        chunk = response.read(STREAM_CHUNK_SIZE)
+        if not chunk:
+            return True
+        drained += len(chunk)
+    return False
+
+
+def _iter_json_array(response, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Yield the elements of a JSON array while it is read from a file-like response.
+
+    Only the element being parsed and the current chunk are held in memory. An empty body is treated as an empty array.
+    """
+    decoder = json_module.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8')()
+    buffer = ''
+    position = 0
+    eof = False
+    state = 'start'
+    while True:
+        position = _JSON_WHITESPACE.match(buffer, position).end()
+        need_more = False
+
+        if position == len(buffer):
+            if eof:
+                if state == 'start':
+                    return
+                raise ValueError("Unexpected end of JSON array")
+            need_more = True
+        elif state == 'start':
+            if buffer[position] != '[':
+                raise ValueError("Expected a JSON array")
+            position += 1
+            state = 'first'
+        elif state in ('first', 'separator') and buffer[position] == ']':
+            return
+        elif state == 'separator':
+            if buffer[position] != ',':
+                raise ValueError("Expected ',' or ']' in JSON array")
+            position += 1
+            state = 'value'
+        else:
+            # Parse the next element, reading more data if it is incomplete. A number may continue in the next chunk,
+            # so an element is only accepted once the following separator has been received.
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+                end = None
+            if end is not None and not eof:
+                following = _JSON_WHITESPACE.match(buffer, end).end()
+                if following == len(buffer) or buffer[following] not in ',]':
+                    end = None
+            if end is None:
+                need_more = True
+            else:
+                position = end
+                state = 'separator'
+                yield item
+
+        if need_more:
+            chunk = response.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + text_decoder.decode(chunk or b'', final=eof)
+            position = 0
+
+
+class ApiError(Exception):
+    """Raised by api_call for HTTP error responses, status_code holds the HTTP status"""
+
+    def __init__(self, message, status_code):
+        super(ApiError, self).__init__(message)
+        self.status_code = status_code
+
+
+class ApiResponse(object):
+    """
+    Response returned by api_call.
+
+    The body is kept in one representation only: the raw bytes until the JSON is first accessed, afterwards
+    the parsed JSON, as the bytes are released once they were parsed. Besides .json(), .status_code and .text,
+    the keys of a JSON object can be accessed as items or attributes.
+    """
+
+    __slots__ = ('status_code', '_content', '_json')
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self._content = content
+        self._json = _UNPARSED
+
+    def copy(self):
+        """Return a response of its own for another caller, with a deep copy of the JSON if it was already parsed"""
+        # json() sets _json before it releases _content, so read _content first
+        content = self._content
+        data = self._json
+        response = ApiResponse(self.status_code, content)
+        if data is not _UNPARSED:
+            response._json = copy.deepcopy(data)
+        return response
+
+    def json(self):
+        """Return the parsed JSON data (can be dict, list, or other types), or {} for an empty or invalid body"""
+        if self._json is _UNPARSED:
+            try:
+                self._json = json_module.loads(self._content) if self._content else {}
+                if self._content:
+                    self._content = None
+            except ValueError:
+                self._json = {}
+        return self._json
+
+    @property
+    def text(self):
+        """Return the body as text, serialized again from the parsed JSON if the raw body was already released"""
+        if self._content is None:
+            return json_module.dumps(self._json)
+        return self._content.decode('utf-8') if isinstance(self._content, bytes) else self._content
+
+    def _object(self):
+        data = self.json()
+        return data if isinstance(data, dict) else {}
+
+    def __getitem__(self, key):
+        return self._object()[key]
+
+    def __contains__(self, key):
+        return key in self._object()
+
+    def __iter__(self):
+        return iter(self._object())
+
+    def __len__(self):
+        return len(self._object())
+
+    def get(self, key, default=None):
+        return self._object().get(key, default)
+
+    def keys(self):
+        return self._object().keys()
+
+    def values(self):
+        return self._object().values()
+
+    def items(self):
+        return self._object().items()
+
+    def __getattr__(self, name):
+        """Allow attribute access to the keys of a JSON object"""
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            return self._object()[name]
+        except KeyError:
+            raise AttributeError("'{0}' object has no attribute '{1}'".format(self.__class__.__name__, name))
+
+
+def _request(method, url, headers, data, verify):
+    """
+    Send a request and return (status_code, content), answering GET requests from the response cache if enabled.
+    Logs in again once on HTTP 401 and drops cached collections and responses affected by writes.
+    """
+    # Answer from the response cache if enabled, or revalidate the cached response with a conditional request
+    cache = _response_cache(url) if method == 'GET' else None
+    cached = cache.lookup(url) if cache else None
+    if cached and cached['fresh']:
+        return 200, cached['content']
+
+    if cached:
+        headers = dict(headers or {})
+        headers.update(cached['validators'])
+    status_code, content, response_headers = _send_with_renewal(method, url, headers, data, verify)
+
+    if method != 'GET':
+        invalidate_resource_indexes(url)
+        _invalidate_flights(url)
+        for response_cache in _response_caches.values():
+            response_cache.invalidate(url)
+        for snapshot_store in _snapshot_stores.values():
+            snapshot_store.invalidate(url)
+    elif cached and status_code == 304:
+        status_code, content = 200, cached['content']
+    elif cache and status_code == 200:
+        cache.store(url, content, response_headers.get('ETag'), response_headers.get('Last-Modified'))
+
+    return status_code, content
+
+
+class _Flight(object):
+    """
+    A GET request of the current module run, shared by identical GET requests while in flight and within the dedup window.
+
+    result holds a private ApiResponse that no caller holds, every caller including the first receives a copy of
+    its own, so changes to the parsed JSON never reach other callers. A response kept for the dedup window is parsed
+    once and only keeps the parsed JSON, as the raw body is released.
+    """
+
+    __slots__ = ('event', 'result', 'error', 'completed')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+        self.completed = None
+
+
+def _shared_get(url, headers, verify):
+    """
+    Send a GET request and return an ApiResponse. Identical GET requests sent meanwhile wait for this one
+    and share its response, as do identical GET requests within the dedup window of the API after a successful response.
+    """
+    headers = _current_headers(headers)
+    key = (url, _request_token(headers))
+    window = _dedup_window(url)
+    now = time.time()
+    with _flight_lock:
+        for flight_key in [flight_key for flight_key, flight in _flights.items() if flight.completed is not None and flight.completed + window <= now]:
+            del _flights[flight_key]
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        flight.event.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result.copy()
+
+    try:
+        flight.result = ApiResponse(*_request("GET", url, headers, None, verify))
+        if window > 0 and flight.result.status_code < 400:
+            flight.result.json()
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flight_lock:
+            flight.completed = time.time()
+            # Only successful responses are reused after the request completed
+            if _flights.get(key) is flight and (flight.error is not None or flight.result.status_code >= 400 or window <= 0):
+                del _flights[key]
+        flight.event.set()
+    return flight.result.copy()
+
+
+def _invalidate_flights(url):
+    """Stop sharing the responses of GET requests affected by a write to the given URL"""
+    with _flight_lock:
+        for key in list(_flights):
+            if url == key[0] or url.startswith(key[0] + '/') or key[0].startswith(url + '/'):
+                del _flights[key]
+
+
+def _dedup_window(url):
+    """Return the dedup window configured for the API of the given URL"""
+    for api_url, window in _dedup_windows.items():
+        if url == api_url or url.startswith(api_url + '/'):
+            return window
+    return 0
+
 
 def api_call(method, url, headers=None, json=None, verify=True, module=None, fail_msg=None):
     """Make API call and return response data"""
@@ -28,59 +606,17 @@ def api_call(method, url, headers=None, json=None, verify=True, module=None, fai
                 headers = dict(headers)  # Create a copy to avoid modifying the original
             headers['Content-Type'] = 'application/json'
 
-        response = open_url(
-            url,
-            method=method,
-            headers=headers,
-            data=data,
-            validate_certs=verify,
-            http_agent='ansible-alpaca-operator'
-        )
+        if method == 'GET':
+            response = _shared_get(url, headers, verify)
+        else:
+            response = ApiResponse(*_request(method, url, headers, data, verify))
 
-        status_code = response.getcode()
-        content = response.read()
-        text = content.decode('utf-8') if isinstance(content, bytes) else content
-
-        if status_code >= 400:
+        if response.status_code >= 400:
             if module and fail_msg:
-                module.fail_json(msg="{0}: {1}".format(fail_msg, text))
-            raise Exception("HTTP {0}: {1}".format(status_code, text))
-
-        # Parse JSON if content exists, otherwise return empty dict
-        try:
-            json_result = json_module.loads(text) if text else {}
-        except ValueError:
-            json_result = {}
-
-        class ResponseDict(dict):
-            """Dictionary-like object with json() method and attribute access for compatibility"""
-            def __init__(self, status_code, text, json_data):
-                # Only initialize dict with json_data if it's a dict, otherwise store as attribute
-                if isinstance(json_data, dict):
-                    super(ResponseDict, self).__init__(json_data)
-                else:
-                    super(ResponseDict, self).__init__()
-                self._status_code = status_code
-                self._text = text
-                self._json_data = json_data
-
-            def json(self):
-                """Return the parsed JSON data (can be dict, list, or other types)"""
-                return self._json_data
-
-            def __getattr__(self, name):
-                """Allow attribute access to status_code, text, and dictionary keys"""
-                if name == 'status_code':
-                    return self._status_code
-                elif name == 'text':
-                    return self._text
-                try:
-                    return self[name]
-                except KeyError:
-                    raise AttributeError("'{0}' object has no attribute '{1}'".format(self.__class__.__name__, name))
+                module.fail_json(msg="{0}: {1}".format(fail_msg, response.text))
+            raise ApiError("HTTP {0}: {1}".format(response.status_code, response.text), response.status_code)
 
-        result = ResponseDict(status_code, text, json_result)
-        return result
+        return response
 
     except Exception as e:
         if module:
@@ -89,43 +625,835 @@ def api_call(method, url, headers=None, json=None, verify=True, module=None, fai
         raise
 
 
-def get_token(api_url, username, password, verify):
-    """Get API token"""
+def _login(api_url, username, password, verify):
+    """Login against the API and return a new token"""
     payload = {"username": username, "password": password}
     response = api_call("POST", "{0}/auth/login".format(api_url), json=payload, verify=verify)
     return response.json()["token"]
 
 
+def _token_expiry(token, ttl):
+    """Return the expiry timestamp of a JWT token, or now + ttl if it does not carry one"""
+    try:
+        claims = token.split('.')[1]
+        claims += '=' * (-len(claims) % 4)
+        expiry = json_module.loads(base64.urlsafe_b64decode(claims.encode('utf-8')).decode('utf-8')).get('exp')
+        if expiry:
+            return float(expiry)
+    except (IndexError, TypeError, ValueError, AttributeError):
+        pass
+    return time.time() + ttl
+
+
+def _token_cache_file(cache_dir, api_url, username):
+    """Return the token cache file for (protocol, host, port, username)"""
+    parts = urlsplit(api_url)
+    key = json_module.dumps([parts.scheme, parts.hostname, parts.port, username])
+    return os.path.join(os.path.expanduser(cache_dir), "token-{0}.json".format(hashlib.sha256(key.encode('utf-8')).hexdigest()))
+
+
+def _cached_login(api_url, username, password, verify, cache_file, ttl, rejected_token=None):
+    """
+    Return a valid token from the token cache file or login and store the new token.
+
+    The cache file is protected by an exclusive file lock, so concurrent forks wait for the
+    first one to login and then reuse its token instead of logging in themselves.
+    """
+    cache_dir = os.path.dirname(cache_file)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, 0o700)
+
+    with open(cache_file + '.lock', 'a') as lock_file:
+        if HAS_FCNTL:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            try:
+                with open(cache_file) as f:
+                    cached = json_module.load(f)
+                if cached['token'] != rejected_token and cached['expires'] - TOKEN_EXPIRY_MARGIN > time.time():
+                    return cached['token']
+            except (IOError, OSError, KeyError, TypeError, ValueError):
+                pass
+
+            token = _login(api_url, username, password, verify)
+            fd, tmp_file = tempfile.mkstemp(dir=cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json_module.dump({"token": token, "expires": _token_expiry(token, ttl)}, f)
+            os.rename(tmp_file, cache_file)
+            return token
+        finally:
+            if HAS_FCNTL:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def _obtain_token(login, rejected_token=None):
+    """Login with the given login settings, using the token cache if enabled"""
+    if login['cache_file']:
+        try:
+            return _cached_login(login['api_url'], login['username'], login['password'], login['verify'],
+                                 login['cache_file'], login['cache_ttl'], rejected_token)
+        except (IOError, OSError):
+            # An unusable cache directory must not break the module, login directly instead
+            pass
+    return _login(login['api_url'], login['username'], login['password'], login['verify'])
+
+
+def _request_token(headers):
+    """Return the bearer token of the given request headers"""
+    authorization = (headers or {}).get('Authorization') or ''
+    return authorization[len('Bearer '):] if authorization.startswith('Bearer ') else None
+
+
+def _current_headers(headers):
+    """Replace a token that has been renewed in the meantime with the current one"""
+    token = _request_token(headers)
+    if token not in _renewed_tokens:
+        return headers
+    headers = dict(headers)
+    headers['Authorization'] = "Bearer {0}".format(_renewed_tokens[token])
+    return headers
+
+
+def _renew_token(url, headers):
+    """Login again after the API rejected the token of the given request, return True on success"""
+    token = _request_token(headers)
+    if not token:
+        return False
+
+    with _auth_lock:
+        if token in _renewed_tokens:
+            return True
+        for api_url, login in _logins.items():
+            if url.startswith(api_url) and login['token'] == token:
+                try:
+                    login['token'] = _obtain_token(login, rejected_token=token)
+                except Exception:
+                    return False
+                _renewed_tokens[token] = login['token']
+                return True
+    return False
+
+
+def _register_login(api_url, username, password, verify, cache_dir=None, cache_ttl=TOKEN_CACHE_TTL, token=None):
+    """Register the login settings for api_url and return them, logging in unless a token is given"""
+    login = {
+        "api_url": api_url,
+        "username": username,
+        "password": password,
+        "verify": verify,
+        "cache_file": _token_cache_file(cache_dir, api_url, username) if cache_dir and username else None,
+        "cache_ttl": cache_ttl,
+        "token": token,
+    }
+    if not token:
+        login['token'] = _obtain_token(login)
+    if username:
+        with _auth_lock:
+            _logins[api_url] = login
+    return login
+
+
+def get_token(api_url, username, password, verify, cache_dir=None, cache_ttl=TOKEN_CACHE_TTL):
+    """
+    Get API token.
+
+    If cache_dir is given, the token is shared through a token cache file keyed by
+    (protocol, host, port, username) until it expires. Requests sent with this token
+    login again automatically when the API rejects it with HTTP 401.
+    """
+    return _register_login(api_url, username, password, verify, cache_dir=cache_dir, cache_ttl=cache_ttl)['token']
+
+
+def get_api_url(api_connection):
+    """Return the base URL of the API described by the api_connection parameter"""
+    return "{0}://{1}:{2}/api".format(api_connection['protocol'], api_connection['host'], api_connection['port'])
+
+
+def get_api_token(api_url, api_connection):
+    """
+    Return the token for the api_connection parameter.
+
+    A pre-issued token is used as is. If username and password are given as well, they are
+    used to login again when the API rejects the pre-issued token.
+    """
+    cache_dir = (api_connection.get('token_cache_dir') or TOKEN_CACHE_DIR) if api_connection.get('token_cache') else None
+    cache_ttl = api_connection.get('token_cache_ttl')
+    login = _register_login(api_url, api_connection.get('username'), api_connection.get('password'), api_connection['tls_verify'],
+                            cache_dir=cache_dir, cache_ttl=TOKEN_CACHE_TTL if cache_ttl is None else cache_ttl,
+                            token=api_connection.get('token'))
+    return login['token']
+
+
+def _register_local_proxy(api_url, api_connection):
+    """Route the requests to api_url through the local API proxy if enabled by the api_connection parameter, return True if so"""
+    if not api_connection.get('local_proxy'):
+        return False
+    from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_proxy import start_local_proxy
+    socket_path = start_local_proxy(api_url, api_connection)
+    if socket_path:
+        _local_proxies[api_url] = socket_path
+    return bool(socket_path)
+
+
+def get_auth_headers(api_url, api_connection):
+    """
+    Authenticate with the api_connection parameter and return the request headers.
+
+    Requests sent through the local API proxy or the persistent httpapi connection need no headers,
+    both authenticate them with their own login.
+    """
+    _dedup_windows[api_url] = api_connection.get('dedup_window', DEDUP_WINDOW) or 0
+    _register_response_cache(api_url, api_connection)
+    _register_snapshot_store(api_url, api_connection)
+    if _persistent_connection(api_url) or _register_local_proxy(api_url, api_connection):
+        return {}
+    return {"Authorization": "Bearer {0}".format(get_api_token(api_url, api_connection))}
+
+
+class ResponseCache(object):
+    """
+    On-disk cache of GET responses, shared by all forks and module runs on the host.
+
+    Responses with an ETag or Last-Modified header are revalidated with a conditional request and reused
+    when the API answers 304 Not Modified. Responses without validators are reused for ttl seconds.
+    Once the cached bodies exceed max_size bytes, the least recently used responses are evicted.
+    The cache index is protected by an exclusive file lock. Errors accessing the cache are ignored,
+    so an unusable cache directory never breaks a module run.
+    """
+
+    def __init__(self, cache_dir, ttl, max_size):
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._index_file = os.path.join(self.cache_dir, 'index.json')
+
+    @contextlib.contextmanager
+    def _locked_index(self):
+        """Yield the cache index while holding the cache lock, the index is written back if it was changed"""
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir, 0o700)
+        with open(self._index_file + '.lock', 'a') as lock_file:
+            if HAS_FCNTL:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                try:
+                    with open(self._index_file) as f:
+                        index = json_module.load(f)
+                except (IOError, OSError, ValueError):
+                    index = {}
+                original = json_module.dumps(index, sort_keys=True)
+                yield index
+                if json_module.dumps(index, sort_keys=True) != original:
+                    self._write_file(self._index_file, json_module.dumps(index).encode('utf-8'))
+            finally:
+                if HAS_FCNTL:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _write_file(self, path, content):
+        fd, tmp_file = tempfile.mkstemp(dir=self.cache_dir)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.rename(tmp_file, path)
+
+    def _remove(self, index, url):
+        entry = index.pop(url)
+        try:
+            os.remove(os.path.join(self.cache_dir, entry['file']))
+        except OSError:
+            pass
+
+    def lookup(self, url):
+        """
+        Return the cached response of url as a dictionary with content, the conditional request headers
+        (validators) and whether it can be used without asking the API (fresh), or None.
+        """
+        try:
+            with self._locked_index() as index:
+                entry = index.get(url)
+                if not entry:
+                    return None
+                with open(os.path.join(self.cache_dir, entry['file']), 'rb') as f:
+                    content = f.read()
+                entry['used'] = time.time()
+        except (IOError, OSError, KeyError, TypeError, ValueError):
+            return None
+
+        validators = {}
+        if entry.get('etag'):
+            validators['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            validators['If-Modified-Since'] = entry['last_modified']
+        return {
+            "content": content,
+            "validators": validators,
+            "fresh": not validators and entry['stored'] + self.ttl > time.time(),
+        }
+
+    def store(self, url, content, etag=None, last_modified=None):
+        """Store a response and evict the least recently used responses above the size limit"""
+        if len(content) > self.max_size:
+            return
+        try:
+            with self._locked_index() as index:
+                name = "{0}.body".format(hashlib.sha256(url.encode('utf-8')).hexdigest())
+                self._write_file(os.path.join(self.cache_dir, name), content)
+                now = time.time()
+                index[url] = {"file": name, "size": len(content), "etag": etag, "last_modified": last_modified, "stored": now, "used": now}
+
+                size = sum(entry['size'] for entry in index.values())
+                for cached_url in sorted(index, key=lambda cached_url: index[cached_url]['used']):
+                    if size <= self.max_size:
+                        break
+                    size -= index[cached_url]['size']
+                    self._remove(index, cached_url)
+        except (IOError, OSError, KeyError, TypeError, ValueError):
+            pass
+
+    def invalidate(self, url):
+        """Drop the cached responses of all collections and items affected by a write to the given URL"""
+        try:
+            with self._locked_index() as index:
+                for cached_url in list(index):
+                    if url == cached_url or url.startswith(cached_url + '/') or cached_url.startswith(url + '/'):
+                        self._remove(index, cached_url)
+        except (IOError, OSError, KeyError, TypeError, ValueError):
+            pass
+
+
+def _response_cache(url):
+    """Return the response cache enabled for the API of the given URL, or None"""
+    for api_url, cache in _response_caches.items():
+        if url == api_url or url.startswith(api_url + '/'):
+            return cache
+    return None
+
+
+def _register_response_cache(api_url, api_connection):
+    """Enable the on-disk response cache for api_url if requested by the api_connection parameter"""
+    if api_connection.get('response_cache'):
+        ttl = api_connection.get('response_cache_ttl')
+        _response_caches[api_url] = ResponseCache(api_connection.get('response_cache_dir') or RESPONSE_CACHE_DIR,
+                                                  RESPONSE_CACHE_TTL if ttl is None else ttl,
+                                                  (api_connection.get('response_cache_size') or RESPONSE_CACHE_SIZE) * 1024 * 1024)
+
+
+def _snapshot_value(value):
+    """Return the text stored in a row index column for an item value, or None if the value is not indexed"""
+    if isinstance(value, bool) or not isinstance(value, string_types + integer_types):
+        return None
+    return text_type(value)
+
+
+class SnapshotStore(object):
+    """
+    SQLite cache of collection snapshots, shared by all forks and module runs on the host.
+
+    The items of a collection are stored as rows with indexes on their id, name, hostname and globalId, so
+    lookups read single rows instead of the whole collection. Filling a snapshot is serialized by a file lock per
+    collection, so the first fork downloads a collection while the others wait and read its snapshot, and forks
+    needing other collections are not blocked. Every collection has a
+    generation counter. A write through any fork increments the generation of the affected collections and drops
+    their items, and a snapshot is only stored if the generation did not change while it was downloaded.
+    Errors accessing the cache are ignored, so an unusable cache file never breaks a module run.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+        self._local = threading.local()
+
+    def _connection(self):
+        """Return the database connection of the current thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            connection = sqlite3.connect(self.path, timeout=HTTP_TIMEOUT * 3, isolation_level=None)
+            connection.executescript(_SNAPSHOT_SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    @contextlib.contextmanager
+    def _transaction(self, mode='DEFERRED'):
+        connection = self._connection()
+        connection.execute("BEGIN {0}".format(mode))
+        try:
+            yield connection
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    @contextlib.contextmanager
+    def _fill_lock(self, url):
+        self._connection()
+        with open("{0}.{1}.lock".format(self.path, hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]), 'a') as lock_file:
+            if HAS_FCNTL:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if HAS_FCNTL:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _snapshot(self, url):
+        """Return the generation of the collection and whether its snapshot is fresh, registering the collection if unknown"""
+        with self._transaction('IMMEDIATE') as connection:
+            connection.execute("INSERT OR IGNORE INTO collections (url, generation) VALUES (?, 0)", (url,))
+            generation, fetched = connection.execute("SELECT generation, fetched FROM collections WHERE url = ?", (url,)).fetchone()
+        return generation, fetched is not None and fetched + self.ttl > time.time()
+
+    def _store(self, url, generation, items):
+        """Store the items of a collection unless a write invalidated the collection after generation was read"""
+        rows = []
+        for position, item in enumerate(items):
+            columns = [_snapshot_value(item.get(key)) if isinstance(item, dict) else None for key in ('id', 'name', 'hostname', 'globalId')]
+            rows.append([url, position] + columns + [json_module.dumps(item)])
+        try:
+            with self._transaction('IMMEDIATE') as connection:
+                row = connection.execute("SELECT generation FROM collections WHERE url = ?", (url,)).fetchone()
+                if not row or row[0] != generation:
+                    return
+                connection.execute("DELETE FROM items WHERE collection = ?", (url,))
+                connection.executemany("INSERT INTO items VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                connection.execute("UPDATE collections SET fetched = ? WHERE url = ?", (time.time(), url))
+        except sqlite3.Error:
+            pass
+
+    def _read(self, url, generation, where='', parameters=()):
+        """Return the parsed bodies of the matching items in collection order, or None if the snapshot is no longer current"""
+        try:
+            with self._transaction() as connection:
+                row = connection.execute("SELECT generation, fetched FROM collections WHERE url = ?", (url,)).fetchone()
+                if not row or row[0] != generation or row[1] is None:
+                    return None
+                bodies = connection.execute("SELECT body FROM items WHERE collection = ?{0} ORDER BY position".format(where),
+                                            (url,) + tuple(parameters)).fetchall()
+        except sqlite3.Error:
+            return None
+        return [json_module.loads(body) for (body,) in bodies]
+
+    def fresh(self, url):
+        """Return True if a fresh snapshot of the collection exists"""
+        try:
+            row = self._connection().execute("SELECT fetched FROM collections WHERE url = ?", (url,)).fetchone()
+        except (IOError, OSError, sqlite3.Error):
+            return False
+        return bool(row) and row[0] is not None and row[0] + self.ttl > time.time()
+
+    def index(self, url, index_class, fetch):
+        """
+        Return the index of a collection, answered from its snapshot if fresh. Otherwise the collection is
+        fetched with fetch() while holding the fill lock of the collection and stored as new snapshot.
+        """
+        fetching = False
+        try:
+            with self._fill_lock(url):
+                generation, fresh = self._snapshot(url)
+                if fresh:
+                    return SnapshotIndex(self, url, generation, index_class, fetch)
+                fetching = True
+                index = index_class(fetch())
+                self._store(url, generation, index.items)
+                return index
+        except (IOError, OSError, sqlite3.Error):
+            if fetching:
+                raise
+        return index_class(fetch())
+
+    def invalidate(self, url):
+        """Increment the generation of all collections affected by a write to the given URL and drop their snapshots"""
+        try:
+            with self._transaction('IMMEDIATE') as connection:
+                for (collection_url,) in connection.execute("SELECT url FROM collections").fetchall():
+                    if url == collection_url or url.startswith(collection_url + '/') or collection_url.startswith(url + '/'):
+                        connection.execute("UPDATE collections SET generation = generation + 1, fetched = NULL WHERE url = ?", (collection_url,))
+                        connection.execute("DELETE FROM items WHERE collection = ?", (collection_url,))
+        except (IOError, OSError, sqlite3.Error):
+            pass
+
+
+def _snapshot_store(url):
+    """Return the snapshot cache enabled for the API of the given URL, or None"""
+    for api_url, store in _snapshot_stores.items():
+        if url == api_url or url.startswith(api_url + '/'):
+            return store
+    return None
+
+
+def _register_snapshot_store(api_url, api_connection):
+    """Enable the SQLite snapshot cache for api_url if requested by the api_connection parameter and sqlite3 is available"""
+    if api_connection.get('snapshot_cache') and HAS_SQLITE3:
+        ttl = api_connection.get('snapshot_cache_ttl')
+        _snapshot_stores[api_url] = SnapshotStore(api_connection.get('snapshot_cache_path') or SNAPSHOT_CACHE_PATH,
+                                                  SNAPSHOT_CACHE_TTL if ttl is None else ttl)
+
+
+class ResourceIndex(object):
+    """Items of a collection with hash indexes on their lookup keys, built on first use of a key"""
+
+    def __init__(self, items):
+        self.items = items
+        self._indexes = {}
+
+    def _index_key(self, value):
+        return value
+
+    def get(self, key, value):
+        """Return the first item whose key equals value, or None"""
+        index = self._indexes.get(key)
+        if index is None:
+            index = {}
+            for item in self.items:
+                try:
+                    index.setdefault(self._index_key(item.get(key)), item)
+                except TypeError:
+                    # Unhashable values (lists, dicts) are never used as lookup keys
+                    pass
+            self._indexes[key] = index
+        try:
+            return index.get(self._index_key(value))
+        except TypeError:
+            return None
+
+
+class ProcessTreeIndex(ResourceIndex):
+    """Processes of all process types of the process tree, indexed by the string value of their keys"""
+
+    def __init__(self, tree):
+        super(ProcessTreeIndex, self).__init__([process for type in tree for process in type.get('processes', [])])
+
+    def _index_key(self, value):
+        return str(value)
+
+
+class SnapshotIndex(ResourceIndex):
+    """
+    Index of a collection snapshot in the snapshot cache. Lookups by a key with a row index read the matching rows only,
+    other lookups load all items. If the snapshot was invalidated in the meantime, the collection is fetched with fetch().
+    """
+
+    def __init__(self, store, url, generation, index_class, fetch):
+        super(SnapshotIndex, self).__init__(None)
+        self._store = store
+        self._url = url
+        self._generation = generation
+        self._fetch = fetch
+        self._matcher = index_class([])
+        self._found = {}
+
+    def _index_key(self, value):
+        return self._matcher._index_key(value)
+
+    def get(self, key, value):
+        """Return the first item whose key equals value, or None"""
+        text = _snapshot_value(value)
+        if self.items is None and key in SNAPSHOT_KEYS and text is not None:
+            if (key, text) not in self._found:
+                self._found[(key, text)] = self._store._read(self._url, self._generation, " AND {0} = ?".format(SNAPSHOT_KEYS[key]), [text])
+            items = self._found[(key, text)]
+            if items is not None:
+                return next((item for item in items if self._index_key(item.get(key)) == self._index_key(value)), None)
+
+        if self.items is None:
+            self.items = self._store._read(self._url, self._generation)
+            if self.items is None:
+                self.items = self._matcher.__class__(self._fetch()).items
+        return super(SnapshotIndex, self).get(key, value)
+
+
+def get_resource_index(api_url, headers, resource, verify, index_class=ResourceIndex):
+    """
+    Return the index of a collection, fetching the collection at most once per module run.
+
+    If the snapshot cache is enabled, a fresh snapshot stored by another fork or module run is used instead.
+    """
+    url = "{0}/{1}".format(api_url, resource)
+    with _index_lock:
+        index = _resource_indexes.get(url)
+    if index is None:
+        def fetch():
+            return api_call("GET", url, headers=headers, verify=verify).json() or []
+
+        store = _snapshot_store(url)
+        index = store.index(url, index_class, fetch) if store else index_class(fetch())
+        with _index_lock:
+            _resource_indexes[url] = index
+    return index
+
+
+def invalidate_resource_indexes(url):
+    """Drop the indexes of all collections and the items affected by a write to the given URL"""
+    with _index_lock:
+        for collection_url in list(_resource_indexes):
+            if url == collection_url or url.startswith(collection_url + '/'):
+                del _resource_indexes[collection_url]
+        for item_url in list(_resource_items):
+            if url == item_url or url.startswith(item_url + '/') or item_url.startswith(url + '/'):
+                del _resource_items[item_url]
+
+
+def run_concurrently(func, items, max_concurrency=MAX_CONCURRENCY):
+    """
+    Call func for every item using at most max_concurrency worker threads.
+
+    Returns a list of (result, exception) tuples in the order of items, so callers can
+    process the results deterministically and decide how to handle failures themselves.
+    """
+    def call(item):
+        try:
+            return func(item), None
+        except Exception as e:
+            return None, e
+
+    items = list(items)
+    if not HAS_CONCURRENT_FUTURES or (max_concurrency or 1) <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(max_concurrency, len(items))) as executor:
+        return list(executor.map(call, items))
+
+
+def api_get_concurrently(urls, headers, verify, max_concurrency=MAX_CONCURRENCY):
+    """GET all urls with bounded parallelism and return a list of (json, exception) tuples in the order of urls"""
+    return run_concurrently(lambda url: api_call("GET", url, headers=headers, verify=verify).json(), urls, max_concurrency)
+
+
 def lookup_resource(api_url, headers, resource, key, value, verify):
     """Find resource by the given key and value"""
-    response = api_call("GET", "{0}/{1}".format(api_url, resource), headers=headers, verify=verify)
-    for resource in response.json():
-        if resource.get(key) == value:
-            return resource
-    return None
+    return get_resource_index(api_url, headers, resource, verify).get(key, value)
+
+
+def lookup_resource_by_id(api_url, headers, resource, resource_id, verify, module=None, fail_msg=None):
+    """
+    Find resource by ID without downloading the whole collection.
+
+    Answers from the collection index if the collection was already fetched in this module run or has a fresh
+    snapshot in the snapshot cache, otherwise GETs the resource by ID once per module run. Returns None if the API answers 404.
+    If module is given, failed requests end with module.fail_json like api_call.
+    """
+    try:
+        return _lookup_resource_by_id(api_url, headers, resource, resource_id, verify)
+    except Exception as e:
+        if module:
+            module.fail_json(msg="{0}: {1}".format(fail_msg or 'API request failed.', str(e)))
+        raise
+
+
+def _lookup_resource_by_id(api_url, headers, resource, resource_id, verify):
+    url = "{0}/{1}".format(api_url, resource)
+    item_url = "{0}/{1}".format(url, resource_id)
+    with _index_lock:
+        index = _resource_indexes.get(url)
+        if index is None and item_url in _resource_items:
+            return _resource_items[item_url]
+    if index is None and _snapshot_store(url) and _snapshot_store(url).fresh(url):
+        index = get_resource_index(api_url, headers, resource, verify)
+    if index is not None:
+        return index.get("id", resource_id)
+
+    try:
+        item = api_call("GET", item_url, headers=headers, verify=verify).json() or None
+    except ApiError as e:
+        if e.status_code != 404:
+            raise
+        item = None
+    with _index_lock:
+        _resource_items[item_url] = item
+    return item
+
+
+def scan_resource(api_url, headers, resource, key, values, verify, module=None, fail_msg=None):
+    """
+    Find the first item of a collection for each of the given key values with a single request.
+
+    Answers from the collection index if the collection was already fetched in this module run. Otherwise the
+    collection is parsed while it is received and the download stops as soon as all values were found, so memory
+    use is bounded by a single element instead of the whole collection.
+
+    Returns a dictionary mapping each value to its item, or None if not found. If module is given, failed requests
+    end with module.fail_json like api_call, e.g. when the API rejects a pre-issued token.
+    """
+    try:
+        return _scan_resource(api_url, headers, resource, key, values, verify)
+    except Exception as e:
+        if module:
+            module.fail_json(msg="{0}: {1}".format(fail_msg or 'API request failed.', str(e)))
+        raise
+
+
+def _scan_resource(api_url, headers, resource, key, values, verify):
+    found = dict((value, None) for value in values if value is not None)
+    if not found:
+        return found
+
+    url = "{0}/{1}".format(api_url, resource)
+    with _index_lock:
+        index = _resource_indexes.get(url)
+    if index is None and (_response_cache(url) or _snapshot_store(url) or _persistent_connection(url)):
+        # A cached collection is usually revalidated or shared without downloading it, so use the cache instead of streaming.
+        # The persistent httpapi connection cannot stream responses.
+        index = get_resource_index(api_url, headers, resource, verify)
+    if index is not None:
+        return dict((value, index.get(key, value)) for value in found)
+
+    headers = _current_headers(headers)
+    status_code, response, done = _open_response("GET", url, headers, None, verify)
+
+    # Re-login once if the API rejected a token obtained by get_token (e.g. expired or revoked)
+    if status_code == 401 and _renew_token(url, headers):
+        response.read()
+        done(True)
+        headers = _current_headers(headers)
+        status_code, response, done = _open_response("GET", url, headers, None, verify)
+
+    complete = False
+    try:
+        if status_code >= 400:
+            content = response.read()
+            complete = True
+            raise ApiError("HTTP {0}: {1}".format(status_code, content.decode('utf-8') if isinstance(content, bytes) else content), status_code)
+
+        remaining = set(found)
+        for item in _iter_json_array(response):
+            try:
+                value = item.get(key) if isinstance(item, dict) else None
+                if value in remaining:
+                    found[value] = item
+                    remaining.discard(value)
+            except TypeError:
+                # Unhashable values (lists, dicts) are never used as lookup keys
+                pass
+            if not remaining:
+                # A keep-alive connection can only be reused once the body was read. Reading the rest of a small
+                # collection is cheaper than a new connection and TLS handshake, a large rest is cheaper to drop.
+                complete = not getattr(response, 'will_close', True) and _drain(response, SCAN_DRAIN_LIMIT)
+                break
+        else:
+            response.read()
+            complete = True
+    finally:
+        done(complete)
+
+    return found
+
+
+def lookup_process(api_url, headers, key, value, verify):
+    """Find process by the given key and value, fetching the process tree at most once per module run"""
+    return get_resource_index(api_url, headers, "processes/tree", verify, index_class=ProcessTreeIndex).get(key, value)
 
 
 def lookup_processId(api_url, headers, key, value, verify):
     """Find processId by the given key and value"""
-    response = api_call("GET", "{0}/processes/tree".format(api_url), headers=headers, verify=verify)
-    for type in response.json():
-        for process in type.get('processes', []):
-            if str(process.get(key)) == str(value):
-                return process.get('id')
-    return None
+    process = lookup_process(api_url, headers, key, value, verify)
+    return process.get('id') if process else None
+
+
+def command_summary_differs(desired_command, agent_hostname, command_summary, build_payload):
+    """
+    Check if a command as listed by GET /systems/{id}/commands may differ from the desired command.
+    Options that are not set in the desired command keep their current value and never differ.
+    The full command only has to be fetched for comparison if a set option differs from the summary
+    or is not part of the summary.
+
+    Parameters:
+        desired_command (dict): The desired command with resolved agent and process IDs.
+        agent_hostname (str): Hostname of the desired agent.
+        command_summary (dict): The command as listed by the ALPACA Operator API.
+        build_payload (callable): build_payload(desired_command, system_command) of the calling module.
+
+    Returns:
+        bool: False if the summary already matches all set options of the desired command.
+    """
+    if command_summary.get('agentHostname', None) != agent_hostname:
+        return True
+
+    payload = build_payload(desired_command, command_summary)
+    for option, key in [('name', 'name'), ('process_id', 'processId'), ('parameters', 'parameters'), ('schedule', 'schedule'),
+                        ('parameters_needed', 'parametersNeeded'), ('disabled', 'disabled'), ('critical', 'critical'), ('history', 'history'),
+                        ('auto_deploy', 'autoDeploy'), ('timeout', 'timeout'), ('escalation', 'escalation')]:
+        if desired_command.get(option, None) is not None and (key not in command_summary or payload[key] != command_summary[key]):
+            return True
+
+    return False
+
+
+def get_api_connection(module):
+    """
+    Return the api_connection parameter of the module with defaults applied.
+
+    If the task uses the pcg.alpaca_operator.alpaca httpapi connection, all requests are sent through its persistent
+    connection, which holds the login and the keep-alive connections for the whole play. Protocol, host, port and
+    tls_verify are then taken from the connection and api_connection may be omitted.
+    """
+    api_connection = module.params.get('api_connection')
+    socket_path = getattr(module, '_socket_path', None)
+    if socket_path:
+        connection = Connection(socket_path)
+        try:
+            settings = connection.get_api_settings()
+        except ConnectionError:
+            # Another persistent connection, e.g. of a network collection, send requests directly
+            settings = None
+        if settings:
+            options = get_api_connection_argument_spec()['options']
+            api_connection = dict((name, option.get('default')) for name, option in options.items())
+            api_connection.update((name, value) for name, value in (module.params.get('api_connection') or {}).items() if value is not None)
+            api_connection.update(settings)
+            _persistent_connections[get_api_url(api_connection)] = connection
+            module.params['api_connection'] = api_connection
+            _check_non_negative_options(module, api_connection)
+            return api_connection
+
+    if not api_connection:
+        module.fail_json(msg="missing required arguments: api_connection, unless the task uses the pcg.alpaca_operator.alpaca httpapi connection")
+    if not api_connection.get('username') and not api_connection.get('token'):
+        module.fail_json(msg="one of the following is required: username, token found in api_connection")
+    _check_non_negative_options(module, api_connection)
+    return api_connection
+
+
+def get_negative_options(api_connection):
+    """Return the names of the api_connection options that must not be negative but are"""
+    return [name for name in NON_NEGATIVE_OPTIONS if api_connection.get(name) is not None and api_connection[name] < 0]
+
+
+def _check_non_negative_options(module, api_connection):
+    negative = get_negative_options(api_connection)
+    if negative:
+        module.fail_json(msg="api_connection options must not be negative: {0}".format(", ".join(negative)))
 
 
 def get_api_connection_argument_spec():
     """Return the argument spec for api_connection parameter"""
     return dict(
         type='dict',
-        required=True,
+        required=False,
         options=dict(
             host=dict(type='str', required=False, default='localhost'),
             port=dict(type='int', required=False, default='8443'),
             protocol=dict(type='str', required=False, default='https', choices=['http', 'https']),
-            username=dict(type='str', required=True, no_log=True),
-            password=dict(type='str', required=True, no_log=True),
-            tls_verify=dict(type='bool', required=False, default=True)
-        )
+            username=dict(type='str', required=False, no_log=True),
+            password=dict(type='str', required=False, no_log=True),
+            token=dict(type='str', required=False, no_log=True),
+            tls_verify=dict(type='bool', required=False, default=True),
+            token_cache=dict(type='bool', required=False, default=False),
+            token_cache_dir=dict(type='path', required=False, default=TOKEN_CACHE_DIR),
+            token_cache_ttl=dict(type='int', required=False, default=TOKEN_CACHE_TTL),
+            max_concurrency=dict(type='int', required=False, default=MAX_CONCURRENCY),
+            response_cache=dict(type='bool', required=False, default=False),
+            response_cache_dir=dict(type='path', required=False, default=RESPONSE_CACHE_DIR),
+            response_cache_ttl=dict(type='int', required=False, default=RESPONSE_CACHE_TTL),
+            response_cache_size=dict(type='int', required=False, default=RESPONSE_CACHE_SIZE),
+            snapshot_cache=dict(type='bool', required=False, default=False),
+            snapshot_cache_path=dict(type='path', required=False, default=SNAPSHOT_CACHE_PATH),
+            snapshot_cache_ttl=dict(type='int', required=False, default=SNAPSHOT_CACHE_TTL),
+            local_proxy=dict(type='bool', required=False, default=False),
+            local_proxy_dir=dict(type='path', required=False, default=LOCAL_PROXY_DIR),
+            local_proxy_idle_timeout=dict(type='int', required=False, default=LOCAL_PROXY_IDLE_TIMEOUT),
+            local_proxy_max_connections=dict(type='int', required=False, default=LOCAL_PROXY_MAX_CONNECTIONS),
+            dedup_window=dict(type='int', required=False, default=DEDUP_WINDOW)
+        ),
+        required_together=[('username', 'password')]
     )
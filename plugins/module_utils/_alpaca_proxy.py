@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+
+# This module is for internal use only within the pcg.alpaca_operator collection.
+# Python versions supported: 3.8+
+
+# Local multiplexing proxy for the ALPACA Operator API. The first module run with api_connection.local_proxy enabled
+# starts the proxy as a daemon listening on a Unix socket. All forks of the host then send their requests through it,
+# so the proxy keeps a single login and keep-alive pool to the API, sends identical GET requests that are in flight
+# at the same time only once and limits the number of parallel upstream requests.
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import errno
+import hashlib
+import json
+import os
+import select
+import socket
+import threading
+import time
+
+from ansible.module_utils.six.moves import BaseHTTPServer, socketserver
+from ansible.module_utils.six.moves.urllib.parse import urlsplit
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils import _alpaca_api
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import (
+    HTTP_TIMEOUT,
+    LOCAL_PROXY_DIR,
+    LOCAL_PROXY_IDLE_TIMEOUT,
+    LOCAL_PROXY_MAX_CONNECTIONS,
+    _send_with_renewal,
+    get_api_token,
+)
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    HAS_FCNTL = False
+
+HAS_UNIX_SOCKETS = hasattr(socket, 'AF_UNIX') and hasattr(os, 'fork')
+
+LOCAL_PROXY_START_TIMEOUT = HTTP_TIMEOUT * 2
+STATS_PATH = '/_proxy/stats'
+
+# Request headers passed to the API, conditional headers also distinguish otherwise identical GET requests
+FORWARDED_REQUEST_HEADERS = ('Content-Type', 'Accept', 'If-None-Match', 'If-Modified-Since')
+FORWARDED_RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class _Flight(object):
+    """A GET request in flight to the API, shared by all clients sending the same request meanwhile"""
+
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+
+class ApiProxy(object):
+    """
+    Upstream side of the local proxy: one login and keep-alive pool to the API, merging of identical in-flight
+    GET requests, a limit on parallel upstream requests and hit/miss counters.
+    """
+
+    def __init__(self, api_url, api_connection, max_connections):
+        parts = urlsplit(api_url)
+        self.origin = "{0}://{1}".format(parts.scheme, parts.netloc)
+        self.verify = api_connection['tls_verify']
+        self.headers = {"Authorization": "Bearer {0}".format(get_api_token(api_url, api_connection))}
+        self.stats = {"requests": 0, "hits": 0, "misses": 0, "writes": 0, "errors": 0, "active": 0}
+        self.last_request = time.time()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self.stats[name] += value
+            self.last_request = time.time()
+
+    def _upstream(self, method, path, data, headers):
+        """Send a request to the API, logging in again once if the API rejects the token"""
+        url = self.origin + path
+        with self._slots:
+            try:
+                status_code, content, response_headers = _send_with_renewal(method, url, dict(self.headers, **headers), data, self.verify)
+            except Exception as e:
+                self._count('errors')
+                return 502, json.dumps({"error": "Local ALPACA Operator API proxy failed: {0}".format(str(e))}).encode('utf-8'), {}
+        return status_code, content, dict((name, response_headers.get(name)) for name in FORWARDED_RESPONSE_HEADERS if response_headers.get(name))
+
+    def forward(self, method, path, data, headers):
+        """Return (status_code, content, response_headers) of a request, merging it with an identical GET in flight"""
+        self._count('requests')
+        if method != 'GET':
+            self._count('writes')
+            result = self._upstream(method, path, data, headers)
+            # Later GET requests must not join a request that was sent before the write
+            with self._lock:
+                for key in list(self._flights):
+                    if path == key[0] or path.startswith(key[0] + '/') or key[0].startswith(path + '/'):
+                        del self._flights[key]
+            return result
+
+        key = (path, tuple(sorted(headers.items())))
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            self.stats['misses' if leader else 'hits'] += 1
+        if not leader:
+            flight.event.wait()
+            return flight.result
+
+        try:
+            flight.result = self._upstream(method, path, None, headers)
+        finally:
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            flight.event.set()
+        return flight.result
+
+
+class _ProxyRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self):
+        proxy = self.server.proxy
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else None
+
+        proxy._count('active')
+        try:
+            if self.command == 'GET' and self.path == STATS_PATH:
+                with proxy._lock:
+                    content = json.dumps(proxy.stats).encode('utf-8')
+                status_code, response_headers = 200, {'Content-Type': 'application/json'}
+            else:
+                headers = dict((name, self.headers.get(name)) for name in FORWARDED_REQUEST_HEADERS if self.headers.get(name))
+                status_code, content, response_headers = proxy.forward(self.command, self.path, data, headers)
+        finally:
+            proxy._count('active', -1)
+
+        self.send_response(status_code)
+        for name, value in response_headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+
+class _ProxyServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # All forks may connect at the same time
+    request_queue_size = 256
+
+
+def local_proxy_socket(api_url, api_connection):
+    """Return the socket path of the local proxy for the API and credentials of the api_connection parameter"""
+    key = json.dumps([api_url, api_connection.get('username'), api_connection.get('password'), api_connection.get('token'),
+                      bool(api_connection['tls_verify'])])
+    # Unix socket paths are limited to about 100 characters, so only part of the hash is used
+    return os.path.join(os.path.expanduser(api_connection.get('local_proxy_dir') or LOCAL_PROXY_DIR),
+                        "proxy-{0}.sock".format(hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]))
+
+
+def _is_running(socket_path):
+    """Check whether a proxy listens on the given socket, a busy proxy counts as running"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(1)
+    try:
+        client.connect(socket_path)
+    except socket.timeout:
+        return True
+    except (IOError, OSError) as e:
+        return e.errno not in (errno.ENOENT, errno.ECONNREFUSED)
+    finally:
+        client.close()
+    return True
+
+
+def _serve(socket_path, api_url, api_connection, ready_fd):
+    """Run the proxy in the daemon process until it was idle for local_proxy_idle_timeout seconds"""
+    server = None
+    try:
+        devnull = os.open(os.devnull, os.O_RDWR)
+        for fd in (0, 1, 2):
+            os.dup2(devnull, fd)
+        os.chdir('/')
+        os.umask(0o077)
+        # Connections and proxies of the module process must not be used by the daemon
+        _alpaca_api._idle_connections.clear()
+        _alpaca_api._local_proxies.clear()
+
+        proxy = ApiProxy(api_url, api_connection, api_connection.get('local_proxy_max_connections') or LOCAL_PROXY_MAX_CONNECTIONS)
+        server = _ProxyServer(socket_path, _ProxyRequestHandler)
+        server.proxy = proxy
+        os.write(ready_fd, b'ready')
+        os.close(ready_fd)
+        ready_fd = None
+
+        idle_timeout = api_connection.get('local_proxy_idle_timeout') or LOCAL_PROXY_IDLE_TIMEOUT
+
+        def watchdog():
+            while proxy.stats['active'] or time.time() - proxy.last_request < idle_timeout:
+                time.sleep(1)
+            server.shutdown()
+
+        thread = threading.Thread(target=watchdog)
+        thread.daemon = True
+        thread.start()
+        server.serve_forever()
+    except Exception as e:
+        if ready_fd is not None:
+            os.write(ready_fd, "error: {0}".format(str(e)).encode('utf-8'))
+    finally:
+        if server is not None:
+            try:
+                os.remove(socket_path)
+            except OSError:
+                pass
+        os._exit(0)
+
+
+def _spawn(socket_path, api_url, api_connection):
+    """Start the proxy as a detached daemon and wait until it accepts connections, return True on success"""
+    ready_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Detach from the module process, so the daemon outlives it and Ansible does not wait for it
+        try:
+            os.close(ready_fd)
+            os.setsid()
+            if os.fork() == 0:
+                _serve(socket_path, api_url, api_connection, write_fd)
+        finally:
+            os._exit(0)
+
+    os.close(write_fd)
+    try:
+        os.waitpid(pid, 0)
+        readable = select.select([ready_fd], [], [], LOCAL_PROXY_START_TIMEOUT)[0]
+        return bool(readable) and os.read(ready_fd, 1024) == b'ready'
+    finally:
+        os.close(ready_fd)
+
+
+def start_local_proxy(api_url, api_connection):
+    """
+    Return the socket path of the local proxy for the api_connection parameter, starting the proxy if it is not running.
+
+    Returns None if the proxy is not available on this host or could not be started, e.g. because the login failed.
+    The caller then sends its requests to the API directly, which reports such errors in the usual way.
+    """
+    if not HAS_UNIX_SOCKETS:
+        return None
+
+    socket_path = local_proxy_socket(api_url, api_connection)
+    if _is_running(socket_path):
+        return socket_path
+
+    try:
+        proxy_dir = os.path.dirname(socket_path)
+        if not os.path.isdir(proxy_dir):
+            os.makedirs(proxy_dir, 0o700)
+        # Only one fork starts the proxy, the others wait for it and use it
+        with open(socket_path + '.lock', 'a') as lock_file:
+            if HAS_FCNTL:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                if _is_running(socket_path):
+                    return socket_path
+                if os.path.exists(socket_path):
+                    os.remove(socket_path)
+                return socket_path if _spawn(socket_path, api_url, api_connection) else None
+            finally:
+                if HAS_FCNTL:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+    except (IOError, OSError):
+        return None
@@ -213,62 +213,35 @@ changes:
                 desired: true
 '''
 
-from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import api_call, get_token, lookup_resource, get_api_connection_argument_spec
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import api_call, get_api_url, get_api_connection, get_auth_headers, scan_resource, get_api_connection_argument_spec
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_agent import build_payload, get_changes
 from ansible.module_utils.basic import AnsibleModule
 
 
-def build_payload(desired_agent_config, current_agent_config):
-    """
-    Constructs a configuration payload by prioritizing values from the desired configuration
-    dictionary. If a value is not provided in the desired configuration, the function falls
-    back to using the corresponding value from the existing configuration (if available).
-
-    Parameters:
-        desired_agent_config (dict): A dictionary containing the desired configuration values.
-        current_agent_config (dict): A dictionary with existing configuration values.
-
-    Returns:
-        dict: A combined configuration payload dictionary.
-    """
-
-    payload = {
-        "description":              desired_agent_config.get('description', None)                                           if desired_agent_config.get('description', None)                                            is not None else current_agent_config.get('description', ''),
-        "escalation": {
-            "failuresBeforeReport": (desired_agent_config.get('escalation') or {}).get('failures_before_report', None)     if (desired_agent_config.get('escalation') or {}).get('failures_before_report', None)      is not None else current_agent_config.get('escalation', {}).get('failuresBeforeReport', 0),
-            "mailAddress":          (desired_agent_config.get('escalation') or {}).get('mail_address', None)                if (desired_agent_config.get('escalation') or {}).get('mail_address', None)                 is not None else current_agent_config.get('escalation', {}).get('mailAddress', ''),
-            "mailEnabled":          (desired_agent_config.get('escalation') or {}).get('mail_enabled', None)                if (desired_agent_config.get('escalation') or {}).get('mail_enabled', None)                 is not None else current_agent_config.get('escalation', {}).get('mailEnabled', False),
-            "smsAddress":           (desired_agent_config.get('escalation') or {}).get('sms_address', None)                 if (desired_agent_config.get('escalation') or {}).get('sms_address', None)                  is not None else current_agent_config.get('escalation', {}).get('smsAddress', ''),
-            "smsEnabled":           (desired_agent_config.get('escalation') or {}).get('sms_enabled', None)                 if (desired_agent_config.get('escalation') or {}).get('sms_enabled', None)                  is not None else current_agent_config.get('escalation', {}).get('smsEnabled', False),
-        },
-        "hostname":                 desired_agent_config.get('new_name', None) or desired_agent_config.get('name', None)    if desired_agent_config.get('new_name', None) or desired_agent_config.get('name', None)     is not None else current_agent_config.get('hostname', ''),
-        "ipAddress":                desired_agent_config.get('ip_address', None)                                            if desired_agent_config.get('ip_address', None)                                             is not None else current_agent_config.get('ipAddress', ''),
-        "location":                 desired_agent_config.get('location', None)                                              if desired_agent_config.get('location', None)                                               is not None else current_agent_config.get('location', 'virtual'),
-        "scriptGroupId":            desired_agent_config.get('script_group_id', None)                                       if desired_agent_config.get('script_group_id', None)                                        is not None else current_agent_config.get('scriptGroupId', -1),
-    }
-
-    return payload
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        name=dict(type='str', required=True),       # = hostname
+        new_name=dict(type='str', required=False),  # = hostname
+        description=dict(type='str', required=False),
+        escalation=dict(type='dict', required=False),
+        ip_address=dict(type='str', required=False),
+        location=dict(type='str', required=False, default='virtual', choices=['virtual', 'local1', 'local2', 'remote']),
+        script_group_id=dict(type='int', required=False, default=-1),
+        state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+        api_connection=get_api_connection_argument_spec()
+    )
 
 
-def main():
-    module = AnsibleModule(
-        argument_spec=dict(
-            name=dict(type='str', required=True),       # = hostname
-            new_name=dict(type='str', required=False),  # = hostname
-            description=dict(type='str', required=False),
-            escalation=dict(type='dict', required=False),
-            ip_address=dict(type='str', required=False),
-            location=dict(type='str', required=False, default='virtual', choices=['virtual', 'local1', 'local2', 'remote']),
-            script_group_id=dict(type='int', required=False, default=-1),
-            state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
-            api_connection=get_api_connection_argument_spec()
-        ),
-        supports_check_mode=True,
-    )
+def run_module(module):
+    """Reconcile the desired state with the API, ends with module.exit_json or module.fail_json"""
+    api_url = get_api_url(get_api_connection(module))
+    headers = get_auth_headers(api_url, module.params['api_connection'])
 
-    api_url = "{0}://{1}:{2}/api".format(module.params['api_connection']['protocol'], module.params['api_connection']['host'], module.params['api_connection']['port'])
-    token = get_token(api_url, module.params['api_connection']['username'], module.params['api_connection']['password'], module.params['api_connection']['tls_verify'])
-    headers = {"Authorization": "Bearer {0}".format(token)}
-    current_agent = lookup_resource(api_url, headers, "agents", "hostname", module.params['name'], module.params['api_connection']['tls_verify']) or lookup_resource(api_url, headers, "agents", "hostname", module.params['new_name'], module.params['api_connection']['tls_verify'])
+    # Scan the agents once for name and new_name, stopping as soon as both were found
+    agents = scan_resource(api_url, headers, "agents", "hostname", [module.params['name'], module.params['new_name']], module.params['api_connection']['tls_verify'],
+                           module=module, fail_msg="Failed to get agents")
+    current_agent = agents.get(module.params['name']) or agents.get(module.params['new_name'])
     current_agent_config = api_call(method="GET", url="{0}/agents/{1}".format(api_url, current_agent.get('id', None)), headers=headers, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to get current agent configuration").json() if current_agent else {}
     agent_payload = build_payload(module.params, current_agent_config)
     diff = {}
@@ -276,22 +249,7 @@ def main():
     if module.params['state'] == 'present':
         if current_agent:
             # Compare current agent configuration with the desired agent configuration if it already exists
-            for key in agent_payload:
-                if key not in ['escalation']:
-                    if agent_payload.get(key, None) != current_agent_config.get(key, None):
-                        diff[key] = {
-                            'current': current_agent_config.get(key, None),
-                            'desired': agent_payload.get(key, None)
-                        }
-                if key in ['escalation']:
-                    for sub_key in agent_payload.get(key, {}):
-                        if agent_payload.get(key, {}).get(sub_key, None) != current_agent_config.get(key, {}).get(sub_key, None):
-                            if key not in diff:
-                                diff[key] = {}
-                            diff[key][sub_key] = {
-                                'current': current_agent_config.get(key, {}).get(sub_key, None),
-                                'desired': agent_payload.get(key, {}).get(sub_key, None)
-                            }
+            diff = get_changes(agent_payload, current_agent_config)
 
             if diff:
                 if module.check_mode:
@@ -324,5 +282,10 @@ def main():
     module.exit_json(changed=True, msg="Agent state processed")
 
 
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,330 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: alpaca_agents
+
+short_description: Manage many ALPACA Operator agents in one task via REST API
+
+version_added: '2.2.0'
+
+extends_documentation_fragment:
+    - pcg.alpaca_operator.api_connection
+
+description: >
+    This module creates, updates or deletes a list of ALPACA Operator agents in one task.
+    The agents collection is fetched once, every entry of O(agents) is compared with the same rules as
+    M(pcg.alpaca_operator.alpaca_agent), and the required requests are sent in parallel,
+    at most O(api_connection.max_concurrency) at a time. Deletions are sent before creations and updates,
+    so a hostname released by a deleted agent can be reused in the same task.
+
+options:
+    agents:
+        description: Desired agents, every entry takes the options of M(pcg.alpaca_operator.alpaca_agent).
+        version_added: '2.2.0'
+        required: true
+        type: list
+        elements: dict
+        suboptions:
+            name:
+                description: Unique name (hostname) of the agent.
+                version_added: '2.2.0'
+                required: true
+                type: str
+            new_name:
+                description: >
+                    Optional new name for the agent. If the agent specified in O(agents[].name) exists,
+                    it will be renamed to this value. If the agent does not exist, a new agent will
+                    be created using this value.
+                version_added: '2.2.0'
+                required: false
+                type: str
+            description:
+                description: Unique description of the agent.
+                version_added: '2.2.0'
+                required: false
+                type: str
+            escalation:
+                description: >
+                    Escalation configuration with the keys C(failures_before_report), C(mail_enabled), C(mail_address),
+                    C(sms_enabled) and C(sms_address), see M(pcg.alpaca_operator.alpaca_agent).
+                version_added: '2.2.0'
+                required: false
+                type: dict
+            ip_address:
+                description: IP address of the agent.
+                version_added: '2.2.0'
+                required: false
+                type: str
+            location:
+                description: Location of the agent. Can be V(virtual), V(local1), V(local2), or V(remote).
+                version_added: '2.2.0'
+                required: false
+                type: str
+                choices: [virtual, local1, local2, remote]
+                default: virtual
+            script_group_id:
+                description: Script Group ID.
+                version_added: '2.2.0'
+                required: false
+                type: int
+                default: -1
+            state:
+                description: Desired state of the agent.
+                version_added: '2.2.0'
+                required: false
+                default: present
+                choices: [present, absent]
+                type: str
+
+notes:
+    - Failed requests do not abort the module. They are reported in the result of the affected agent and the module fails after all requests have been sent.
+    - The configuration of an agent is only fetched separately if the agents collection does not return all compared fields.
+
+requirements:
+    - ALPACA Operator >= 5.6.0
+
+attributes:
+    check_mode:
+        description: Can run in check_mode and return changed status prediction without modifying target.
+        support: full
+
+author:
+    - Jan-Karsten Hansmeyer (@pcg)
+'''
+
+EXAMPLES = r'''
+- name: Ensure agents exist
+  pcg.alpaca_operator.alpaca_agents:
+    agents:
+      - name: agent01
+        ip_address: 192.168.1.101
+        description: Database server
+      - name: agent02
+        ip_address: 192.168.1.102
+        escalation:
+          failures_before_report: 3
+          mail_enabled: true
+          mail_address: my.mail@pcg.io
+      - name: agent03
+        state: absent
+    api_connection:
+      host: localhost
+      port: 8443
+      protocol: https
+      username: secret
+      password: secret
+      tls_verify: false
+      max_concurrency: 8
+
+- name: Onboard all hosts of a datacenter in one task
+  pcg.alpaca_operator.alpaca_agents:
+    agents: "{{ groups['datacenter1'] | map('community.general.dict_kv', 'name') | list }}"
+    api_connection:
+      host: localhost
+      port: 8443
+      protocol: https
+      username: secret
+      password: secret
+      tls_verify: false
+  run_once: true
+  delegate_to: localhost
+'''
+
+RETURN = r'''
+msg:
+    description: Status message indicating the result of the operation
+    returned: always
+    type: str
+    version_added: '2.2.0'
+    sample: "Agents reconciled: 2 created, 1 updated, 0 deleted, 497 unchanged"
+
+changed:
+    description: Indicates whether any agent was changed
+    returned: always
+    type: bool
+    version_added: '2.2.0'
+    sample: true
+
+agents:
+    description: Result of every entry of O(agents), in the same order
+    returned: when the agents were reconciled
+    type: list
+    elements: dict
+    version_added: '2.2.0'
+    contains:
+        name:
+            description: Name of the entry in O(agents)
+            type: str
+            sample: agent01
+        changed:
+            description: Whether the agent was or would be changed
+            type: bool
+            sample: true
+        failed:
+            description: Whether the request for the agent failed
+            type: bool
+            sample: false
+        msg:
+            description: Status message of the agent, like the msg of M(pcg.alpaca_operator.alpaca_agent)
+            type: str
+            sample: Agent updated
+        agent_config:
+            description: Configuration of the created, updated, deleted or unchanged agent
+            type: dict
+            sample: {"id": 7, "hostname": "agent01", "ipAddress": "10.1.1.1", "location": "virtual"}
+        changes:
+            description: Differences between the current and desired configuration of an updated agent
+            type: dict
+            sample: {"ipAddress": {"current": "10.1.1.1", "desired": "10.1.1.2"}}
+'''
+
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import (
+    get_api_url, get_api_connection, get_auth_headers, get_api_connection_argument_spec, get_resource_index, api_call,
+    api_get_concurrently, run_concurrently
+)
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_agent import build_payload, get_changes
+from ansible.module_utils.basic import AnsibleModule
+from collections import Counter
+
+
+def has_full_config(agent):
+    """Check whether an item of the agents collection contains every field compared with the desired configuration"""
+    payload = build_payload({}, {})
+    return (all(key in agent for key in payload)
+            and isinstance(agent.get('escalation'), dict)
+            and all(key in agent['escalation'] for key in payload['escalation']))
+
+
+def plan(spec, current_agent, current_agent_config, api_url, check_mode):
+    """Return the result of an agent entry and the write request it needs, or None"""
+    result = dict(name=spec['name'], changed=False)
+    would = "would be " if check_mode else ""
+
+    if spec['state'] == 'absent':
+        if not current_agent:
+            result['msg'] = "Agent already absent"
+            return result, None
+        result.update(changed=True, msg="Agent {0}deleted".format(would), agent_config=current_agent_config)
+        return result, dict(method="DELETE", url="{0}/agents/{1}".format(api_url, current_agent['id']), fail_msg="Failed to delete agent")
+
+    agent_payload = build_payload(spec, current_agent_config)
+    if not current_agent:
+        result.update(changed=True, msg="Agent {0}created".format(would), agent_config=agent_payload)
+        return result, dict(method="POST", url="{0}/agents".format(api_url), json=agent_payload, fail_msg="Failed to create agent")
+
+    diff = get_changes(agent_payload, current_agent_config)
+    if not diff:
+        result.update(msg="Agent already exists with the desired configuration", agent_config=current_agent_config)
+        return result, None
+    result.update(changed=True, msg="Agent {0}updated".format(would), agent_config=current_agent_config, changes=diff)
+    return result, dict(method="PUT", url="{0}/agents/{1}".format(api_url, current_agent['id']), json=agent_payload, fail_msg="Failed to update agent")
+
+
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        agents=dict(type='list', elements='dict', required=True, options=dict(
+            name=dict(type='str', required=True),       # = hostname
+            new_name=dict(type='str', required=False),  # = hostname
+            description=dict(type='str', required=False),
+            escalation=dict(type='dict', required=False),
+            ip_address=dict(type='str', required=False),
+            location=dict(type='str', required=False, default='virtual', choices=['virtual', 'local1', 'local2', 'remote']),
+            script_group_id=dict(type='int', required=False, default=-1),
+            state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+        )),
+        api_connection=get_api_connection_argument_spec()
+    )
+
+
+def run_module(module):
+    """Reconcile the desired agents with the API, ends with module.exit_json or module.fail_json"""
+    api_url = get_api_url(get_api_connection(module))
+    api_tls_verify = module.params['api_connection']['tls_verify']
+    max_concurrency = module.params['api_connection']['max_concurrency']
+    specs = module.params['agents']
+
+    duplicates = sorted(name for name, count in Counter(spec['name'] for spec in specs).items() if count > 1)
+    if duplicates:
+        module.fail_json(msg="Agents specified more than once: {0}".format(", ".join(duplicates)))
+
+    headers = get_auth_headers(api_url, module.params['api_connection'])
+
+    # Fetch the agents collection once and match every entry by name, or by new_name if it was renamed before
+    try:
+        agents = get_resource_index(api_url, headers, "agents", api_tls_verify)
+    except Exception as e:
+        module.fail_json(msg="Failed to get agents: {0}".format(str(e)))
+    current_agents = [agents.get('hostname', spec['name']) or (agents.get('hostname', spec['new_name']) if spec['new_name'] else None) for spec in specs]
+
+    matched = Counter(agent['id'] for agent in current_agents if agent)
+    conflicts = sorted(spec['name'] for spec, agent in zip(specs, current_agents) if agent and matched[agent['id']] > 1)
+    if conflicts:
+        module.fail_json(msg="Agents matching the same existing agent: {0}".format(", ".join(conflicts)))
+
+    # The collection usually contains the full configuration, only fetch the agents it lacks fields for
+    configs = dict((agent['id'], agent) for agent in current_agents if agent and has_full_config(agent))
+    missing = sorted(set(agent['id'] for agent in current_agents if agent and agent['id'] not in configs))
+    fetched = api_get_concurrently(["{0}/agents/{1}".format(api_url, agent_id) for agent_id in missing], headers, api_tls_verify, max_concurrency)
+    for agent_id, (config, error) in zip(missing, fetched):
+        if error:
+            module.fail_json(msg="Failed to get current agent configuration of agent {0}: {1}".format(agent_id, str(error)))
+        configs[agent_id] = config
+
+    results = []
+    writes = []
+    for index, (spec, current_agent) in enumerate(zip(specs, current_agents)):
+        current_agent_config = configs.get(current_agent['id']) if current_agent else {}
+        result, write = plan(spec, current_agent, current_agent_config, api_url, module.check_mode)
+        results.append(result)
+        if write:
+            write['index'] = index
+            writes.append(write)
+
+    hostnames = Counter(spec['new_name'] or spec['name'] for spec in specs if spec['state'] == 'present')
+    conflicts = sorted(hostname for hostname, count in hostnames.items() if count > 1)
+    if conflicts:
+        module.fail_json(msg="Several agents would get the same hostname: {0}".format(", ".join(conflicts)))
+
+    if not module.check_mode:
+        def send(write):
+            return api_call(write['method'], write['url'], headers=headers, json=write.get('json'), verify=api_tls_verify)
+
+        # Deletions first, so created or renamed agents can take over the hostname of a deleted agent
+        for methods in [("DELETE",), ("POST", "PUT")]:
+            batch = [write for write in writes if write['method'] in methods]
+            for write, (response, error) in zip(batch, run_concurrently(send, batch, max_concurrency)):
+                result = results[write['index']]
+                if error:
+                    result.update(changed=False, failed=True, msg="{0}: {1}".format(write['fail_msg'], str(error)))
+                elif write['method'] != "DELETE":
+                    result['agent_config'] = response.json()
+
+    counts = Counter(write['method'] for write in writes if not results[write['index']].get('failed'))
+    changed = any(result['changed'] for result in results)
+    msg = "Agents {0}: {1} created, {2} updated, {3} deleted, {4} unchanged".format(
+        "would be reconciled" if module.check_mode else "reconciled", counts['POST'], counts['PUT'], counts['DELETE'], len(specs) - len(writes))
+
+    failed = [result for result in results if result.get('failed')]
+    if failed:
+        module.fail_json(msg="Failed to reconcile {0} of {1} agents. {2}".format(len(failed), len(specs), msg), changed=changed, agents=results)
+    module.exit_json(changed=changed, msg=msg, agents=results)
+
+
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
+if __name__ == '__main__':
+    main()
@@ -374,7 +374,7 @@ command:
       agentHostname: "agent-01"
 '''
 
-from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import api_call, get_token, lookup_resource, lookup_processId, get_api_connection_argument_spec
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import api_call, get_api_url, get_api_connection, get_auth_headers, lookup_resource, lookup_resource_by_id, lookup_processId, get_api_connection_argument_spec, command_summary_differs
 from ansible.module_utils.basic import AnsibleModule
 
 
@@ -438,98 +438,98 @@ def build_payload(desired_command, system_command):
     return payload
 
 
-def main():
-    module = AnsibleModule(
-        argument_spec=dict(
-            system=dict(
-                type='dict',
-                required=True,
-                options=dict(
-                    system_id=dict(type='int', required=False),
-                    system_name=dict(type='str', required=False)
-                )
-            ),
-            command=dict(
-                type='dict',
-                required=True,
-                options=dict(
-                    name=dict(type='str', required=False),
-                    agent_id=dict(type='int', required=False),
-                    agent_name=dict(type='str', required=False),
-                    process_id=dict(type='int', required=False),
-                    process_central_id=dict(type='int', required=False),
-                    parameters=dict(type='str', required=False),
-                    schedule=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            period=dict(type='str', required=False, choices=[
-                                'every_5min', 'one_per_day', 'hourly', 'manually', 'fixed_time',
-                                'hourly_with_mn', 'every_minute', 'even_hours_with_mn', 'odd_hours_with_mn',
-                                'even_hours', 'odd_hours', 'fixed_time_once', 'fixed_time_immediate',
-                                'cron_expression', 'disabled', 'start_fixed_time_and_hourly_mn'
-                            ]),
-                            time=dict(type='str', required=False),
-                            cron_expression=dict(type='str', required=False),
-                            days_of_week=dict(type='list', required=False, elements='str', choices=[
-                                'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'
-                            ])
-                        )
-                    ),
-                    parameters_needed=dict(type='bool', required=False),
-                    disabled=dict(type='bool', required=False),
-                    critical=dict(type='bool', required=False),
-                    history=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            document_all_runs=dict(type='bool', required=False),
-                            retention=dict(type='int', required=False)
-                        )
-                    ),
-                    auto_deploy=dict(type='bool', required=False),
-                    timeout=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            type=dict(type='str', required=False, choices=[
-                                'none', 'default', 'custom'
-                            ]),
-                            value=dict(type='int', required=False)
-                        )
-                    ),
-                    escalation=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            mail_enabled=dict(type='bool', required=False),
-                            sms_enabled=dict(type='bool', required=False),
-                            mail_address=dict(type='str', required=False),
-                            sms_address=dict(type='str', required=False),
-                            min_failure_count=dict(type='int', required=False),
-                            triggers=dict(
-                                type='dict',
-                                required=False,
-                                options=dict(
-                                    every_change=dict(type='bool', required=False),
-                                    to_red=dict(type='bool', required=False),
-                                    to_yellow=dict(type='bool', required=False),
-                                    to_green=dict(type='bool', required=False)
-                                )
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        system=dict(
+            type='dict',
+            required=True,
+            options=dict(
+                system_id=dict(type='int', required=False),
+                system_name=dict(type='str', required=False)
+            )
+        ),
+        command=dict(
+            type='dict',
+            required=True,
+            options=dict(
+                name=dict(type='str', required=False),
+                agent_id=dict(type='int', required=False),
+                agent_name=dict(type='str', required=False),
+                process_id=dict(type='int', required=False),
+                process_central_id=dict(type='int', required=False),
+                parameters=dict(type='str', required=False),
+                schedule=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        period=dict(type='str', required=False, choices=[
+                            'every_5min', 'one_per_day', 'hourly', 'manually', 'fixed_time',
+                            'hourly_with_mn', 'every_minute', 'even_hours_with_mn', 'odd_hours_with_mn',
+                            'even_hours', 'odd_hours', 'fixed_time_once', 'fixed_time_immediate',
+                            'cron_expression', 'disabled', 'start_fixed_time_and_hourly_mn'
+                        ]),
+                        time=dict(type='str', required=False),
+                        cron_expression=dict(type='str', required=False),
+                        days_of_week=dict(type='list', required=False, elements='str', choices=[
+                            'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'
+                        ])
+                    )
+                ),
+                parameters_needed=dict(type='bool', required=False),
+                disabled=dict(type='bool', required=False),
+                critical=dict(type='bool', required=False),
+                history=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        document_all_runs=dict(type='bool', required=False),
+                        retention=dict(type='int', required=False)
+                    )
+                ),
+                auto_deploy=dict(type='bool', required=False),
+                timeout=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        type=dict(type='str', required=False, choices=[
+                            'none', 'default', 'custom'
+                        ]),
+                        value=dict(type='int', required=False)
+                    )
+                ),
+                escalation=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        mail_enabled=dict(type='bool', required=False),
+                        sms_enabled=dict(type='bool', required=False),
+                        mail_address=dict(type='str', required=False),
+                        sms_address=dict(type='str', required=False),
+                        min_failure_count=dict(type='int', required=False),
+                        triggers=dict(
+                            type='dict',
+                            required=False,
+                            options=dict(
+                                every_change=dict(type='bool', required=False),
+                                to_red=dict(type='bool', required=False),
+                                to_yellow=dict(type='bool', required=False),
+                                to_green=dict(type='bool', required=False)
                             )
                         )
-                    ),
-                    state=dict(type='str', required=False, default='present', choices=['present', 'absent'])
-                )
-            ),
-            api_connection=get_api_connection_argument_spec()
+                    )
+                ),
+                state=dict(type='str', required=False, default='present', choices=['present', 'absent'])
+            )
         ),
-        supports_check_mode=True,
+        api_connection=get_api_connection_argument_spec()
     )
 
-    api_url = "{0}://{1}:{2}/api".format(module.params['api_connection']['protocol'], module.params['api_connection']['host'], module.params['api_connection']['port'])
-    token = get_token(api_url, module.params['api_connection']['username'], module.params['api_connection']['password'], module.params['api_connection']['tls_verify'])
-    headers = {"Authorization": "Bearer {0}".format(token)}
+
+def run_module(module):
+    """Reconcile the desired state with the API, ends with module.exit_json or module.fail_json"""
+    api_url = get_api_url(get_api_connection(module))
+    headers = get_auth_headers(api_url, module.params['api_connection'])
     command_payload = None
 
     # Check if either a system ID or a system name is provided
@@ -547,7 +547,7 @@ def main():
 
     # Check if system_id is valid
     if module.params.get('system', {}).get('system_id', None):
-        system = lookup_resource(api_url, headers, "systems", "id", module.params['system']['system_id'], module.params['api_connection']['tls_verify'])
+        system = lookup_resource_by_id(api_url, headers, "systems", module.params['system']['system_id'], module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to get system")
         if not system and module.params.get('command', {}).get('state') == "present":
             module.fail_json(msg="System with ID '{0}' not found. Please ensure system is created first.".format(module.params['system']['system_id']))
         elif not system and module.params.get('command', {}).get('state') == "absent":
@@ -568,7 +568,7 @@ def main():
 
     # Check if agent_id is valid
     if module.params.get('command', {}).get('agent_id', None):
-        agent = lookup_resource(api_url, headers, "agents", "id", module.params['command']['agent_id'], module.params['api_connection']['tls_verify'])
+        agent = lookup_resource_by_id(api_url, headers, "agents", module.params['command']['agent_id'], module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to get agent")
         if not agent and module.params.get('command', {}).get('state') == "present":
             module.fail_json(msg="Agent with ID '{0}' not found. Please ensure agent is created first.".format(module.params['command']['agent_id']))
         elif not agent and module.params.get('command', {}).get('state') == "absent":
@@ -592,6 +592,9 @@ def main():
     if system_commands:
         for system_command in system_commands:
             if system_command.get('name', None) == module.params.get('command', {}).get('name', None) and system_command.get('agentHostname', None) == agent.get('hostname', None):
+                # Skip fetching the full command if the summary already matches the desired command
+                if module.params['command']['state'] == 'present' and not command_summary_differs(module.params['command'], agent.get('hostname', None), system_command, build_payload):
+                    module.exit_json(changed=False, msg="Command already exists with the desired configuration in system {0}.".format(module.params['system']['system_id']))
                 system_command = api_call("GET", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], system_command.get('id', None)), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
                 if not system_command:
                     module.fail_json(msg="Failed to retrieve command details of command ID '{0}' in system ID '{1}'".format(module.params['command']['agent_id'], module.params['system']['system_id']))
@@ -667,5 +670,10 @@ def main():
     module.exit_json(changed=False, msg="Command state processed.")
 
 
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
 if __name__ == '__main__':
     main()
@@ -234,6 +234,28 @@ options:
                                 version_added: '2.0.0'
                                 type: bool
                                 required: false
+    parallel_writes:
+        description: >
+            Send the update and delete requests for different commands in parallel, limited by O(api_connection.max_concurrency).
+            New commands are still created one after another in the order of O(commands), as O(reconciliation=position) matches commands by their position.
+            Failed requests do not abort the module. They are collected in RV(failed_commands) and the module fails after all requests have been sent.
+        version_added: '2.2.0'
+        required: false
+        type: bool
+        default: false
+    reconciliation:
+        description: >
+            How desired commands are matched with the commands currently configured on the system.
+            V(position) matches the desired command at index N with the Nth existing command (sorted by ID).
+            Inserting, removing or reordering commands therefore updates all commands after the changed position.
+            V(identity) matches commands with the same agent, name and process first and pairs the remaining commands greedily,
+            those with the fewest differing fields first, so an insert, delete or reorder only sends the requests that are actually needed.
+            The keys of RV(changes) always refer to the index in O(commands).
+        version_added: '2.2.0'
+        required: false
+        type: str
+        default: position
+        choices: [position, identity]
 
 requirements:
     - ALPACA Operator >= 5.6.0
@@ -414,12 +436,110 @@ changes:
                     toRed: true
                     toYellow: true
                     toGreen: true
+
+failed_commands:
+    description: >
+        Error messages of the requests that failed when O(parallel_writes) is enabled, keyed like RV(changes)
+        (C(commandIndex_XXX) for updated or created commands, C(removed_command_<id>) for deleted commands).
+    returned: when O(parallel_writes=true) and at least one request failed
+    type: dict
+    version_added: '2.2.0'
+    sample:
+        commandIndex_003: "Failed to update command 123: HTTP 500: Internal Server Error"
 '''
 
-from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import api_call, get_token, lookup_resource, lookup_processId, get_api_connection_argument_spec
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import api_call, api_get_concurrently, run_concurrently, get_api_url, get_api_connection, get_auth_headers, lookup_resource, lookup_resource_by_id, lookup_processId, get_api_connection_argument_spec, command_summary_differs
 from ansible.module_utils.basic import AnsibleModule
 
 
+def apply_writes(writes, headers, verify, max_concurrency):
+    """
+    Send queued write requests and return a dictionary of error messages keyed by change key.
+
+    Updates and deletions of different commands are independent and sent in parallel.
+    Creations are sent one after another in the queued order, so new commands get
+    ascending IDs in the order of the desired command list.
+    """
+    failures = {}
+
+    def send(write):
+        return api_call(write['method'], write['url'], headers=headers, json=write.get('json'), verify=verify)
+
+    independent_writes = [write for write in writes if write['method'] != 'POST']
+    for write, (result, error) in zip(independent_writes, run_concurrently(send, independent_writes, max_concurrency)):
+        if error:
+            failures[write['key']] = "{0}: {1}".format(write['fail_msg'], str(error))
+
+    for write in [write for write in writes if write['method'] == 'POST']:
+        try:
+            send(write)
+        except Exception as e:
+            failures[write['key']] = "{0}: {1}".format(write['fail_msg'], str(e))
+
+    return failures
+
+
+def command_identity(command):
+    """
+    Return the identity of a system command as listed by the ALPACA Operator API: (agent hostname, name, process ID).
+    """
+    return (command.get('agentHostname', None), command.get('name', None), command.get('processId', None))
+
+
+def plan_reconciliation(desired_identities, system_commands, reconciliation='position'):
+    """
+    Match the desired commands with the currently configured system commands.
+
+    With 'position', the desired command at index i is matched with the i-th system command (sorted by ID).
+    With 'identity', commands with the same agent, name and process are matched first, as they usually need
+    no update at all. The remaining commands are paired greedily, nearest first: pairs with fewer differing
+    identity fields are taken before others, which is not guaranteed to be the pairing with the fewest
+    differing fields overall. Every pairing of the remaining commands costs the same number of requests,
+    one update per pair and a create or delete for each command left over, so the greedy order only decides
+    which commands are updated into which.
+
+    Parameters:
+        desired_identities (list): Identity tuples of the desired commands, see command_identity().
+        system_commands (list): Command summaries of the system, sorted by ID.
+        reconciliation (str): Either 'position' or 'identity'.
+
+    Returns:
+        tuple: A list with the matched system command index (or None) per desired command,
+               and a list with the indexes of the system commands that are not matched.
+    """
+    if reconciliation == 'position':
+        matches = [index if index < len(system_commands) else None for index in range(len(desired_identities))]
+        return matches, list(range(len(desired_identities), len(system_commands)))
+
+    system_identities = [command_identity(command) for command in system_commands]
+    matches = [None] * len(desired_identities)
+    matched = set()
+
+    # Exact identity matches, in ID order for duplicate identities
+    candidates_by_identity = {}
+    for index, identity in enumerate(system_identities):
+        candidates_by_identity.setdefault(identity, []).append(index)
+    for desired_index, identity in enumerate(desired_identities):
+        candidates = candidates_by_identity.get(identity)
+        if candidates:
+            matches[desired_index] = candidates.pop(0)
+            matched.add(matches[desired_index])
+
+    # Pair the remaining commands greedily, fewest differing identity fields first
+    remaining_desired = [index for index, match in enumerate(matches) if match is None]
+    remaining_system = [index for index in range(len(system_commands)) if index not in matched]
+    pairs = sorted(
+        (sum(1 for desired, current in zip(desired_identities[desired_index], system_identities[system_index]) if desired != current), desired_index, system_index)
+        for desired_index in remaining_desired for system_index in remaining_system
+    )
+    for cost, desired_index, system_index in pairs:
+        if matches[desired_index] is None and system_index not in matched:
+            matches[desired_index] = system_index
+            matched.add(system_index)
+
+    return matches, [index for index in range(len(system_commands)) if index not in matched]
+
+
 def build_payload(desired_command, system_command):
     """
     Constructs a configuration payload by prioritizing values from the desired configuration
@@ -481,103 +601,113 @@ def build_payload(desired_command, system_command):
     return payload
 
 
-def main():
-    module = AnsibleModule(
-        argument_spec=dict(
-            system=dict(
-                type='dict',
-                required=True,
-                options=dict(
-                    system_id=dict(type='int', required=False),
-                    system_name=dict(type='str', required=False)
-                )
-            ),
-            commands=dict(
-                type='list',
-                required=False,
-                default=[],
-                elements='dict',
-                options=dict(
-                    name=dict(type='str', required=False),
-                    state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
-                    agent_id=dict(type='int', required=False),
-                    agent_name=dict(type='str', required=False),
-                    process_id=dict(type='int', required=False),
-                    process_central_id=dict(type='int', required=False),
-                    parameters=dict(type='str', required=False),
-                    schedule=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            period=dict(type='str', required=False, choices=[
-                                'every_5min', 'one_per_day', 'hourly', 'manually', 'fixed_time',
-                                'hourly_with_mn', 'every_minute', 'even_hours_with_mn', 'odd_hours_with_mn',
-                                'even_hours', 'odd_hours', 'fixed_time_once', 'fixed_time_immediate',
-                                'cron_expression', 'disabled', 'start_fixed_time_and_hourly_mn'
-                            ]),
-                            time=dict(type='str', required=False),
-                            cron_expression=dict(type='str', required=False),
-                            days_of_week=dict(type='list', required=False, elements='str', choices=[
-                                'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'
-                            ])
-                        )
-                    ),
-                    parameters_needed=dict(type='bool', required=False),
-                    disabled=dict(type='bool', required=False),
-                    critical=dict(type='bool', required=False),
-                    history=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            document_all_runs=dict(type='bool', required=False),
-                            retention=dict(type='int', required=False)
-                        )
-                    ),
-                    auto_deploy=dict(type='bool', required=False),
-                    timeout=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            type=dict(type='str', required=False, choices=[
-                                'none', 'default', 'custom'
-                            ]),
-                            value=dict(type='int', required=False)
-                        )
-                    ),
-                    escalation=dict(
-                        type='dict',
-                        required=False,
-                        options=dict(
-                            mail_enabled=dict(type='bool', required=False),
-                            sms_enabled=dict(type='bool', required=False),
-                            mail_address=dict(type='str', required=False),
-                            sms_address=dict(type='str', required=False),
-                            min_failure_count=dict(type='int', required=False),
-                            triggers=dict(
-                                type='dict',
-                                required=False,
-                                options=dict(
-                                    every_change=dict(type='bool', required=False),
-                                    to_red=dict(type='bool', required=False),
-                                    to_yellow=dict(type='bool', required=False),
-                                    to_green=dict(type='bool', required=False)
-                                )
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        system=dict(
+            type='dict',
+            required=True,
+            options=dict(
+                system_id=dict(type='int', required=False),
+                system_name=dict(type='str', required=False)
+            )
+        ),
+        commands=dict(
+            type='list',
+            required=False,
+            default=[],
+            elements='dict',
+            options=dict(
+                name=dict(type='str', required=False),
+                state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+                agent_id=dict(type='int', required=False),
+                agent_name=dict(type='str', required=False),
+                process_id=dict(type='int', required=False),
+                process_central_id=dict(type='int', required=False),
+                parameters=dict(type='str', required=False),
+                schedule=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        period=dict(type='str', required=False, choices=[
+                            'every_5min', 'one_per_day', 'hourly', 'manually', 'fixed_time',
+                            'hourly_with_mn', 'every_minute', 'even_hours_with_mn', 'odd_hours_with_mn',
+                            'even_hours', 'odd_hours', 'fixed_time_once', 'fixed_time_immediate',
+                            'cron_expression', 'disabled', 'start_fixed_time_and_hourly_mn'
+                        ]),
+                        time=dict(type='str', required=False),
+                        cron_expression=dict(type='str', required=False),
+                        days_of_week=dict(type='list', required=False, elements='str', choices=[
+                            'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday'
+                        ])
+                    )
+                ),
+                parameters_needed=dict(type='bool', required=False),
+                disabled=dict(type='bool', required=False),
+                critical=dict(type='bool', required=False),
+                history=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        document_all_runs=dict(type='bool', required=False),
+                        retention=dict(type='int', required=False)
+                    )
+                ),
+                auto_deploy=dict(type='bool', required=False),
+                timeout=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        type=dict(type='str', required=False, choices=[
+                            'none', 'default', 'custom'
+                        ]),
+                        value=dict(type='int', required=False)
+                    )
+                ),
+                escalation=dict(
+                    type='dict',
+                    required=False,
+                    options=dict(
+                        mail_enabled=dict(type='bool', required=False),
+                        sms_enabled=dict(type='bool', required=False),
+                        mail_address=dict(type='str', required=False),
+                        sms_address=dict(type='str', required=False),
+                        min_failure_count=dict(type='int', required=False),
+                        triggers=dict(
+                            type='dict',
+                            required=False,
+                            options=dict(
+                                every_change=dict(type='bool', required=False),
+                                to_red=dict(type='bool', required=False),
+                                to_yellow=dict(type='bool', required=False),
+                                to_green=dict(type='bool', required=False)
                             )
                         )
                     )
                 )
-            ),
-            api_connection=get_api_connection_argument_spec()
+            )
         ),
-        supports_check_mode=True,
+        parallel_writes=dict(type='bool', required=False, default=False),
+        reconciliation=dict(type='str', required=False, default='position', choices=['position', 'identity']),
+        api_connection=get_api_connection_argument_spec()
     )
 
-    api_url = "{0}://{1}:{2}/api".format(module.params['api_connection']['protocol'], module.params['api_connection']['host'], module.params['api_connection']['port'])
-    token = get_token(api_url, module.params['api_connection']['username'], module.params['api_connection']['password'], module.params['api_connection']['tls_verify'])
-    headers = {"Authorization": "Bearer {0}".format(token)}
+
+def run_module(module):
+    """Reconcile the desired state with the API, ends with module.exit_json or module.fail_json"""
+    api_url = get_api_url(get_api_connection(module))
+    headers = get_auth_headers(api_url, module.params['api_connection'])
     desired_commands = [command for command in module.params['commands'] if command.get('state') == 'present']
     diffs = {}
     removed = []
+    writes = []
+
+    def write(key, method, url, fail_msg, payload=None):
+        """Send a write request right away, or queue it if parallel_writes is enabled"""
+        if module.params['parallel_writes']:
+            writes.append({"key": key, "method": method, "url": url, "json": payload, "fail_msg": fail_msg})
+        else:
+            api_call(method, url, headers=headers, json=payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg=fail_msg)
 
     # Check if either a system ID or a system name is provided
     if not module.params['system'].get('system_name', None) and not module.params['system'].get('system_id', None):
@@ -592,7 +722,7 @@ def main():
 
     # Check if system_id is valid
     if module.params['system'].get('system_id', None):
-        system = lookup_resource(api_url, headers, "systems", "id", module.params['system']['system_id'], module.params['api_connection']['tls_verify'])
+        system = lookup_resource_by_id(api_url, headers, "systems", module.params['system']['system_id'], module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to get system")
         if not system and desired_commands:
             module.fail_json(msg="System with ID '{0}' not found - Please ensure system is created first".format(module.params['system']['system_id']))
 
@@ -602,30 +732,8 @@ def main():
         # system_commands = api_call("GET", "{0}/systems/{1}/commands".format(api_url, module.params['system']['system_id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json()                                        # unsorted list
         system_commands = sorted(api_call("GET", "{0}/systems/{1}/commands".format(api_url, module.params['system']['system_id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json(), key=lambda x: x.get("id", 0))    # sorted by id
 
-    # Delete excess commands
-    desired_commands_count = len([cmd for cmd in module.params['commands'] if cmd.get('state') == 'present'])
-    if len(system_commands) > desired_commands_count:
-        start_index = desired_commands_count
-        for index in range(start_index, len(system_commands)):
-            command = system_commands[index]
-            command_id = command.get('id')
-            if command_id is not None:
-                # Fetch full command configuration before deletion
-                try:
-                    full_command = api_call("GET", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], command_id), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
-                    removed.append(full_command)
-                except Exception:
-                    # Fallback to limited info if full fetch fails
-                    removed.append({"id": command_id, "name": command.get("name"), "processId": command.get("processId"), "agentHostname": command.get("agentHostname")})
-                if not module.check_mode:
-                    api_call("DELETE", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], command_id), headers=headers, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to delete excess command with id {0}".format(command_id))
-
-    # Add removed commands to diffs for logging
-    if removed:
-        diffs["removed_commands"] = removed
-        # Update list of currently configured system commands
-        # system_commands = sorted(api_call("GET", "{0}/systems/{1}/commands".format(api_url, module.params['system']['system_id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json(), key=lambda x: x.get("id", 0)) # sorted by id
-
+    # Resolve and validate agent and process of all desired commands before changing anything
+    desired_identities = []
     for desired_command_index, desired_command in enumerate(desired_commands):
 
         # Check if either an agent ID or a agent name is provided
@@ -641,7 +749,7 @@ def main():
 
         # Check if agent_id is valid
         if desired_command.get('agent_id', None):
-            agent = lookup_resource(api_url, headers, "agents", "id", desired_command['agent_id'], module.params['api_connection']['tls_verify'])
+            agent = lookup_resource_by_id(api_url, headers, "agents", desired_command['agent_id'], module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to get agent")
             if not agent:
                 module.fail_json(msg="Agent with ID '{0}' defined in system command index {1} not found - Please ensure agent is created first".format(desired_command['agent_id'], desired_command_index))
 
@@ -656,11 +764,49 @@ def main():
                 module.fail_json(msg="Process ID lookup for Central ID '{0}' defined in system command index {1} not found".format(desired_command['process_central_id'], desired_command_index))
             desired_command['process_id'] = process_id
 
-        # Get currently configured system command at the same index as the desired command defined in ansible yaml
-        try:
-            system_command = api_call("GET", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], system_commands[desired_command_index]['id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
-        except Exception:
-            system_command = {}
+        desired_identities.append((agent['hostname'], desired_command.get('name', None), desired_command['process_id']))
+
+    # Match desired commands with the currently configured system commands
+    matches, excess = plan_reconciliation(desired_identities, system_commands, module.params['reconciliation'])
+
+    # Fetch the full configuration in parallel, but only of commands that are removed or whose summary may differ from the desired command
+    detail_indexes = sorted(set(excess) | set(
+        match for desired_command, identity, match in zip(desired_commands, desired_identities, matches)
+        if match is not None and command_summary_differs(desired_command, identity[0], system_commands[match], build_payload)
+    ))
+    system_command_details = dict(zip(detail_indexes, api_get_concurrently(["{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], system_commands[index].get('id')) for index in detail_indexes], headers, module.params['api_connection']['tls_verify'], module.params['api_connection']['max_concurrency'])))
+
+    # Delete excess commands
+    for index in excess:
+        command = system_commands[index]
+        command_id = command.get('id')
+        if command_id is not None:
+            full_command, error = system_command_details[index]
+            if not error:
+                removed.append(full_command)
+            else:
+                # Fallback to limited info if full fetch fails
+                removed.append({"id": command_id, "name": command.get("name"), "processId": command.get("processId"), "agentHostname": command.get("agentHostname")})
+            if not module.check_mode:
+                write("removed_command_{0}".format(command_id), "DELETE", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], command_id), "Failed to delete excess command with id {0}".format(command_id))
+
+    # Add removed commands to diffs for logging
+    if removed:
+        diffs["removed_commands"] = removed
+        # Update list of currently configured system commands
+        # system_commands = sorted(api_call("GET", "{0}/systems/{1}/commands".format(api_url, module.params['system']['system_id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json(), key=lambda x: x.get("id", 0)) # sorted by id
+
+    for desired_command_index, desired_command in enumerate(desired_commands):
+
+        # Get currently configured system command matched with the desired command defined in ansible yaml
+        system_command = {}
+        if matches[desired_command_index] is not None:
+            if matches[desired_command_index] not in system_command_details:
+                # Summary already matches the desired command
+                continue
+            system_command, error = system_command_details[matches[desired_command_index]]
+            if error:
+                module.fail_json(msg="Failed to retrieve command details of command ID '{0}' in system ID '{1}': {2}".format(system_commands[matches[desired_command_index]].get('id'), module.params['system']['system_id'], str(error)))
 
         # Create command payload (for comparison and later use)
         command_payload = build_payload(desired_command, system_command)
@@ -701,13 +847,18 @@ def main():
                 diffs['commandIndex_{0:03d}'.format(desired_command_index)] = diff
                 if not module.check_mode:
                     # Update command
-                    api_call("PUT", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], system_command['id']), headers=headers, json=command_payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to update command {0}".format(system_command['id']))
+                    write('commandIndex_{0:03d}'.format(desired_command_index), "PUT", "{0}/systems/{1}/commands/{2}".format(api_url, module.params['system']['system_id'], system_command['id']), "Failed to update command {0}".format(system_command['id']), command_payload)
 
         else:
             # Create command if it does not exist already
             diffs['commandIndex_{0:03d}'.format(desired_command_index)] = {'new_command_payload': command_payload}
             if not module.check_mode:
-                api_call("POST", "{0}/systems/{1}/commands".format(api_url, module.params['system']['system_id']), headers=headers, json=command_payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to create command")
+                write('commandIndex_{0:03d}'.format(desired_command_index), "POST", "{0}/systems/{1}/commands".format(api_url, module.params['system']['system_id']), "Failed to create command", command_payload)
+
+    if writes:
+        failed_commands = apply_writes(writes, headers, module.params['api_connection']['tls_verify'], module.params['api_connection']['max_concurrency'])
+        if failed_commands:
+            module.fail_json(msg="Failed to apply {0} of {1} command changes in system {2}".format(len(failed_commands), len(writes), module.params['system']['system_id']), changes=diffs, failed_commands=failed_commands)
 
     if diffs:
         if module.check_mode:
@@ -718,5 +869,10 @@ def main():
     module.exit_json(changed=False, msg="Command state processed")
 
 
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
 if __name__ == '__main__':
     main()
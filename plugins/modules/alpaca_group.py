@@ -125,44 +125,34 @@ name:
     sample: testgroup01
 '''
 
-from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import get_token, get_api_connection_argument_spec, api_call
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import (
+    get_api_url, get_api_connection, get_auth_headers, get_api_connection_argument_spec, scan_resource, api_call
+)
 from ansible.module_utils.basic import AnsibleModule
 
 
-def find_group(api_url, headers, name, verify):
-    """Find group by name"""
-    response = api_call("GET", "{0}/groups".format(api_url), headers=headers, verify=verify)
-    for group in response.json():
-        if group["name"] == name:
-            return group
-    return None
-
-
-def main():
-    module = AnsibleModule(
-        argument_spec=dict(
-            name=dict(type='str', required=True),
-            new_name=dict(type='str', required=False),
-            state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
-            api_connection=get_api_connection_argument_spec()
-        ),
-        supports_check_mode=True,
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        name=dict(type='str', required=True),
+        new_name=dict(type='str', required=False),
+        state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+        api_connection=get_api_connection_argument_spec()
     )
 
+
+def run_module(module):
+    """Reconcile the desired state with the API, ends with module.exit_json or module.fail_json"""
     name = module.params['name']
     new_name = module.params.get('new_name')
     state = module.params['state']
-    api_host = module.params['api_connection']['host']
-    api_port = module.params['api_connection']['port']
-    api_protocol = module.params['api_connection']['protocol']
-    api_username = module.params['api_connection']['username']
-    api_password = module.params['api_connection']['password']
+    api_url = get_api_url(get_api_connection(module))
     api_tls_verify = module.params['api_connection']['tls_verify']
-    api_url = "{0}://{1}:{2}/api".format(api_protocol, api_host, api_port)
-    api_token = get_token(api_url, api_username, api_password, api_tls_verify)
 
-    headers = {"Authorization": "Bearer {0}".format(api_token)}
-    group = find_group(api_url, headers, name, api_tls_verify)
+    headers = get_auth_headers(api_url, module.params['api_connection'])
+    # Scan the groups once for name and new_name, stopping as soon as both were found, and answer all name checks of this run from the result
+    groups = scan_resource(api_url, headers, "groups", "name", [name, new_name], api_tls_verify, module=module, fail_msg="Failed to get groups")
+    group = groups.get(name)
 
     if state == 'present':
         if group:
@@ -171,7 +161,7 @@ def main():
                 if module.check_mode:
                     module.exit_json(changed=True, msg="Group would be renamed", id=group["id"], name=new_name)
 
-                if not find_group(api_url, headers, new_name, api_tls_verify):
+                if not groups.get(new_name):
                     response = api_call(
                         "PUT",
                         "{0}/groups/{1}".format(api_url, group["id"]),
@@ -194,7 +184,7 @@ def main():
         if new_name:
             name = new_name
 
-        if not find_group(api_url, headers, name, api_tls_verify):
+        if not groups.get(name):
             if module.check_mode:
                 module.exit_json(changed=True, msg="Group would be created", name=name)
 
@@ -232,5 +222,10 @@ def main():
         module.exit_json(changed=True, msg="Group deleted", id=group["id"], name=name)
 
 
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,408 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+DOCUMENTATION = r'''
+---
+module: alpaca_info
+
+short_description: Gather ALPACA Operator groups, agents, systems and processes via REST API
+
+version_added: '2.2.0'
+
+extends_documentation_fragment:
+    - pcg.alpaca_operator.api_connection
+
+description: >
+    This module returns the groups, agents and systems of ALPACA Operator, including the agents, variables and commands
+    of every system, and the process tree in one task without changing anything.
+    The subresources of the systems are fetched in parallel, at most O(api_connection.max_concurrency) requests at a time.
+    For large installations the result can be written to a JSON Lines file instead of the task result.
+
+options:
+    resources:
+        description: Resources to gather.
+        version_added: '2.2.0'
+        required: false
+        default: [groups, agents, systems, processes]
+        type: list
+        elements: str
+        choices: [groups, agents, systems, processes]
+    system_subresources:
+        description: >
+            Subresources fetched for every gathered system. V(commands) returns the command summaries of the command list.
+            Only used if O(resources) contains V(systems).
+        version_added: '2.2.0'
+        required: false
+        default: [agents, variables, commands]
+        type: list
+        elements: str
+        choices: [agents, variables, commands]
+    group_names:
+        description: Only return groups whose name matches one of these shell-style patterns, for example V(prod-*).
+        version_added: '2.2.0'
+        required: false
+        type: list
+        elements: str
+    agent_names:
+        description: Only return agents whose hostname matches one of these shell-style patterns.
+        version_added: '2.2.0'
+        required: false
+        type: list
+        elements: str
+    system_names:
+        description: >
+            Only return systems whose name matches one of these shell-style patterns.
+            The subresources are only fetched for the matching systems.
+        version_added: '2.2.0'
+        required: false
+        type: list
+        elements: str
+    output_path:
+        description: >
+            Write the result as JSON Lines to this file on the host executing the module instead of returning it.
+            Every line is an object with the keys C(resource) and C(item), e.g. one line per system.
+            The systems are fetched and written in batches, so they never have to fit into memory at once.
+            The file is replaced atomically and only if its content changed, it is not written in check mode.
+        version_added: '2.2.0'
+        required: false
+        type: path
+    output_compression:
+        description: Compress the file given in O(output_path) with gzip.
+        version_added: '2.2.0'
+        required: false
+        default: true
+        type: bool
+
+requirements:
+    - ALPACA Operator >= 5.6.0
+
+attributes:
+    check_mode:
+        description: Can run in check_mode and return changed status prediction without modifying target.
+        support: full
+
+author:
+    - Jan-Karsten Hansmeyer (@pcg)
+'''
+
+EXAMPLES = r'''
+- name: Gather everything
+  pcg.alpaca_operator.alpaca_info:
+    api_connection:
+      host: localhost
+      port: 8443
+      protocol: https
+      username: secret
+      password: secret
+      tls_verify: false
+  register: alpaca
+
+- name: Gather the variables of all production systems
+  pcg.alpaca_operator.alpaca_info:
+    resources: [systems]
+    system_subresources: [variables]
+    system_names: ['prd*']
+    api_connection:
+      host: localhost
+      port: 8443
+      protocol: https
+      username: secret
+      password: secret
+      tls_verify: false
+      max_concurrency: 16
+
+- name: Write a snapshot of a large installation to a compressed file
+  pcg.alpaca_operator.alpaca_info:
+    output_path: /var/tmp/alpaca_snapshot.jsonl.gz
+    api_connection:
+      host: localhost
+      port: 8443
+      protocol: https
+      username: secret
+      password: secret
+      tls_verify: false
+'''
+
+RETURN = r'''
+msg:
+    description: Status message indicating the result of the operation
+    returned: always
+    type: str
+    version_added: '2.2.0'
+    sample: ALPACA Operator resources gathered
+
+changed:
+    description: >
+        V(true) if the content of O(output_path) changed, or would change in check mode.
+        Always V(false) without O(output_path), as gathering does not change the ALPACA Operator configuration.
+    returned: always
+    type: bool
+    version_added: '2.2.0'
+    sample: false
+
+counts:
+    description: Number of gathered items per resource
+    returned: always
+    type: dict
+    version_added: '2.2.0'
+    sample: {"groups": 2, "agents": 10, "systems": 5, "processes": 3}
+
+groups:
+    description: Gathered groups
+    returned: when O(resources) contains V(groups) and O(output_path) is not set
+    type: list
+    elements: dict
+    version_added: '2.2.0'
+    sample: [{"id": 1, "name": "production"}]
+
+agents:
+    description: Gathered agents as returned by the API
+    returned: when O(resources) contains V(agents) and O(output_path) is not set
+    type: list
+    elements: dict
+    version_added: '2.2.0'
+    sample: [{"id": 1, "hostname": "agent01", "ipAddress": "10.0.0.1", "location": "virtual"}]
+
+systems:
+    description: >
+        Gathered systems with their general configuration and the subresources selected
+        in O(system_subresources) under the keys C(agents), C(variables) and C(commands)
+    returned: when O(resources) contains V(systems) and O(output_path) is not set
+    type: list
+    elements: dict
+    version_added: '2.2.0'
+    sample: [{"id": 1, "name": "PRD", "groupId": 1, "agents": [{"id": 1, "name": "agent01"}], "variables": [], "commands": []}]
+
+processes:
+    description: Process tree, the process types with their processes
+    returned: when O(resources) contains V(processes) and O(output_path) is not set
+    type: list
+    elements: dict
+    version_added: '2.2.0'
+    sample: [{"name": "Backup", "processes": [{"id": 10, "globalId": 1000, "name": "DB backup"}]}]
+
+output_path:
+    description: Path of the written JSON Lines file
+    returned: when O(output_path) is set
+    type: str
+    version_added: '2.2.0'
+    sample: /var/tmp/alpaca_snapshot.jsonl.gz
+'''
+
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import (
+    get_api_url, get_api_connection, get_auth_headers, get_api_connection_argument_spec, api_get_concurrently
+)
+from ansible.module_utils.basic import AnsibleModule
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import tempfile
+
+# URL of every resource and the key matched by its name filter
+RESOURCES = {
+    'groups': ('groups', 'name', 'group_names'),
+    'agents': ('agents', 'hostname', 'agent_names'),
+    'systems': ('systems', 'name', 'system_names'),
+    'processes': ('processes/tree', None, None),
+}
+
+# Number of systems whose subresources are fetched before they are returned or written
+SYSTEM_BATCH_SIZE = 100
+
+
+class FetchError(Exception):
+    pass
+
+
+def get_all(urls, headers, verify, max_concurrency):
+    """GET all urls in parallel and return the responses in order, raise FetchError for the first failed request"""
+    results = []
+    for url, (result, error) in zip(urls, api_get_concurrently(urls, headers, verify, max_concurrency)):
+        if error:
+            raise FetchError("Failed to fetch {0}: {1}".format(url, str(error)))
+        results.append(result)
+    return results
+
+
+def matches(value, patterns):
+    return not patterns or any(fnmatch.fnmatchcase(value or '', pattern) for pattern in patterns)
+
+
+def iter_system_details(api_url, headers, systems, subresources, verify, max_concurrency):
+    """Yield every system with its general configuration and subresources, fetched in parallel one batch of systems at a time"""
+    suffixes = [""] + ["/" + subresource for subresource in subresources]
+    for start in range(0, len(systems), SYSTEM_BATCH_SIZE):
+        batch = systems[start:start + SYSTEM_BATCH_SIZE]
+        results = get_all(["{0}/systems/{1}{2}".format(api_url, system['id'], suffix) for system in batch for suffix in suffixes],
+                          headers, verify, max_concurrency)
+        for index, system in enumerate(batch):
+            details = results[index * len(suffixes):(index + 1) * len(suffixes)]
+            system = dict(system, **(details[0] or {}))
+            for subresource, result in zip(subresources, details[1:]):
+                system[subresource] = result or []
+            yield system
+
+
+class DigestFile(object):
+    """File object computing the SHA-256 digest of everything written to it, passing the data on to raw unless it is None"""
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def write(self, data):
+        self.digest.update(data)
+        if self.raw:
+            self.raw.write(data)
+        return len(data)
+
+    def flush(self):
+        if self.raw:
+            self.raw.flush()
+
+    def close(self):
+        if self.raw:
+            self.raw.close()
+
+
+def file_digest(path):
+    """Return the SHA-256 digest of a file, or None if it cannot be read"""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(65536), b''):
+                digest.update(chunk)
+    except (IOError, OSError):
+        return None
+    return digest.hexdigest()
+
+
+class JsonLinesWriter(object):
+    """
+    Write items as JSON Lines to a temporary file, which replaces the destination on commit if the content changed.
+
+    In check mode no file is written, only the digest of the content is computed to tell whether it would change.
+    """
+
+    def __init__(self, path, compression, check_mode=False):
+        self.path = path
+        self.tmp_path = None
+        raw = None
+        if not check_mode:
+            fd, self.tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)) or '.', prefix='.alpaca_info')
+            raw = os.fdopen(fd, 'wb')
+        self.raw = DigestFile(raw)
+        # Without a modification time in the gzip header, the same items always give the same file
+        self.file = gzip.GzipFile(fileobj=self.raw, mode='wb', mtime=0) if compression else self.raw
+
+    def write(self, resource, item):
+        self.file.write(json.dumps({"resource": resource, "item": item}, sort_keys=True).encode('utf-8') + b'\n')
+
+    def close(self):
+        # GzipFile does not close a file object passed to it
+        try:
+            self.file.close()
+        finally:
+            self.raw.close()
+
+    def commit(self):
+        """Close the file and replace the destination with it if the content changed, return True if so"""
+        self.close()
+        if self.raw.digest.hexdigest() == file_digest(self.path):
+            self.discard()
+            return False
+        if self.tmp_path:
+            os.rename(self.tmp_path, self.path)
+        return True
+
+    def discard(self):
+        try:
+            self.close()
+        finally:
+            if self.tmp_path and os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
+
+
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        resources=dict(type='list', elements='str', required=False, default=list(RESOURCES), choices=list(RESOURCES)),
+        system_subresources=dict(type='list', elements='str', required=False, default=['agents', 'variables', 'commands'],
+                                 choices=['agents', 'variables', 'commands']),
+        group_names=dict(type='list', elements='str', required=False),
+        agent_names=dict(type='list', elements='str', required=False),
+        system_names=dict(type='list', elements='str', required=False),
+        output_path=dict(type='path', required=False),
+        output_compression=dict(type='bool', required=False, default=True),
+        api_connection=get_api_connection_argument_spec()
+    )
+
+
+def run_module(module):
+    """Gather the selected resources, ends with module.exit_json or module.fail_json"""
+    api_url = get_api_url(get_api_connection(module))
+    api_tls_verify = module.params['api_connection']['tls_verify']
+    max_concurrency = module.params['api_connection']['max_concurrency']
+    resources = [resource for resource in RESOURCES if resource in module.params['resources']]
+    output_path = module.params.get('output_path')
+
+    headers = get_auth_headers(api_url, module.params['api_connection'])
+
+    writer = None
+    if output_path:
+        try:
+            writer = JsonLinesWriter(output_path, module.params['output_compression'], module.check_mode)
+        except (IOError, OSError) as e:
+            module.fail_json(msg="Failed to create {0}: {1}".format(output_path, str(e)))
+
+    result = dict(changed=False, msg="ALPACA Operator resources gathered", counts={})
+    try:
+        # The collections are independent of each other, so they are fetched in parallel as well
+        collections = get_all(["{0}/{1}".format(api_url, RESOURCES[resource][0]) for resource in resources], headers, api_tls_verify, max_concurrency)
+        for resource, items in zip(resources, collections):
+            url, key, filter_option = RESOURCES[resource]
+            items = [item for item in items or [] if not key or matches(item.get(key), module.params.get(filter_option))]
+            if resource == 'systems':
+                items = iter_system_details(api_url, headers, items, module.params['system_subresources'], api_tls_verify, max_concurrency)
+
+            result['counts'][resource] = 0
+            if not output_path:
+                result[resource] = []
+            for item in items:
+                result['counts'][resource] += 1
+                if writer:
+                    writer.write(resource, item)
+                else:
+                    result[resource].append(item)
+
+        if writer:
+            result['changed'] = writer.commit()
+    except Exception as e:
+        if writer:
+            writer.discard()
+        module.fail_json(msg=str(e) if isinstance(e, FetchError) else "Failed to gather resources: {0}".format(str(e)))
+
+    if output_path:
+        result['output_path'] = output_path
+        if module.check_mode:
+            result['msg'] = "ALPACA Operator resources gathered, {0} not written in check mode".format(output_path)
+    module.exit_json(**result)
+
+
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
+if __name__ == '__main__':
+    main()
@@ -293,18 +293,26 @@ changed:
     version_added: '1.0.0'
     type: bool
     returned: always
+missing_variables:
+    description: Names of all desired variables that do not exist in ALPACA Operator
+    version_added: '2.2.0'
+    type: list
+    elements: str
+    returned: when a desired variable does not exist
 '''
 
-from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import get_token, api_call, lookup_resource, get_api_connection_argument_spec
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import get_api_url, get_api_connection, get_auth_headers, api_call, api_get_concurrently, run_concurrently, lookup_resource_by_id, scan_resource, get_resource_index, get_api_connection_argument_spec, MAX_CONCURRENCY
 from ansible.module_utils.basic import AnsibleModule
 import re
 
 
-def get_system_details(api_url, headers, system_id, verify):
-    """Get system details by ID"""
-    general = api_call("GET", "{0}/systems/{1}".format(api_url, system_id), headers=headers, verify=verify).json()
-    agents = api_call("GET", "{0}/systems/{1}/agents".format(api_url, system_id), headers=headers, verify=verify).json()
-    variables = api_call("GET", "{0}/systems/{1}/variables".format(api_url, system_id), headers=headers, verify=verify).json()
+def get_system_details(api_url, headers, system_id, verify, max_concurrency=MAX_CONCURRENCY):
+    """Get system details by ID, fetching the general configuration, agents and variables in parallel"""
+    results = api_get_concurrently(["{0}/systems/{1}{2}".format(api_url, system_id, subresource) for subresource in ["", "/agents", "/variables"]], headers, verify, max_concurrency)
+    for result, error in results:
+        if error:
+            raise error
+    general, agents, variables = [result for result, error in results]
 
     # Clean up description: Current workaround for trailing whitespace returned by API --- #0001
     if "description" in general:
@@ -353,70 +361,116 @@ def build_system_payload(params, current_system_details):
 
 
 def build_variable_payload(api_url, headers, module, desired_vars):
+    """
+    Resolve the desired variables by name against the variable catalogue, which is fetched once per module run.
+    Fails with all variables that do not exist, not only the first one.
+    """
+    variables = get_resource_index(api_url, headers, "variables", module.params['api_connection']['tls_verify'])
     payload = []
+    missing = []
     for variable in desired_vars or []:
-        api_variable = lookup_resource(api_url, headers, "variables", "name", variable['name'], module.params['api_connection']['tls_verify'])
+        api_variable = variables.get("name", variable['name'])
         if not api_variable:
-            module.fail_json(msg="Variable '{0}' not found. Please ensure variable exists first.".format(variable['name']))
+            missing.append(variable['name'])
+            continue
 
         payload.append({"id": api_variable.get('id'), "value": variable.get('value')})
 
+    if len(missing) == 1:
+        module.fail_json(msg="Variable '{0}' not found. Please ensure variable exists first.".format(missing[0]), missing_variables=missing)
+    if missing:
+        module.fail_json(msg="Variables {0} not found. Please ensure variables exist first.".format(", ".join("'{0}'".format(name) for name in missing)), missing_variables=missing)
+
     return payload
 
 
-def main():
-    module = AnsibleModule(
-        argument_spec=dict(
-            name=dict(type='str', required=True),
-            new_name=dict(type='str', required=False),
-            description=dict(type='str', required=False),
-            magic_number=dict(type='int', required=False, choices=list(range(0, 60))),
-            checks_disabled=dict(type='bool', required=False),
-            group_id=dict(type='int', required=False),
-            group_name=dict(type='str', required=False),
-            rfc_connection=dict(
-                type='dict',
-                required=False,
-                options=dict(
-                    type=dict(type='str', required=False, choices=["none", "instance", "messageServer"]),
-                    host=dict(type='str', required=False),
-                    instance_number=dict(type='int', required=False, choices=list(range(0, 100))),
-                    sid=dict(type='str', required=False),
-                    logon_group=dict(type='str', required=False),
-                    username=dict(type='str', required=False, no_log=True),
-                    password=dict(type='str', required=False, no_log=True),
-                    client=dict(type='str', required=False),
-                    sap_router_string=dict(type='str', required=False),
-                    snc_enabled=dict(type='bool', required=False),
-                )
-            ),
-            agents=dict(
-                type='list',
-                elements='dict',
-                required=False,
-                options=dict(
-                    name=dict(type='str', required=True)
-                )
-            ),
-            variables=dict(
-                type='list',
-                elements='dict',
-                required=False,
-                options=dict(
-                    name=dict(type='str', required=True),
-                    value=dict(type='raw', required=True)
-                )
-            ),
-            variables_mode=dict(type='str', required=False, default='update', choices=['update', 'replace']),
-            state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
-            api_connection=get_api_connection_argument_spec()
+def resolve_agents(api_url, headers, module, agent_names, fail_msg):
+    """
+    Resolve agent hostnames against the agents catalogue, which is fetched once per module run.
+    Fails with all agents that do not exist, not only the first one.
+    """
+    agents = get_resource_index(api_url, headers, "agents", module.params['api_connection']['tls_verify'])
+    missing = [name for name in agent_names if not agents.get("hostname", name)]
+    if missing:
+        module.fail_json(msg=fail_msg.format(", ".join(missing)))
+
+    return [agents.get("hostname", name) for name in agent_names]
+
+
+def change_agent_assignments(api_url, headers, module, system_id, method, agents):
+    """
+    Assign (POST) agents to a system in parallel, limited by api_connection.max_concurrency, or unassign (DELETE) them one after another.
+
+    Unassigning is part of the workaround for #0004, where the API does not unassign every agent, so those requests are
+    sent one at a time like before and the first failure ends the module run.
+    """
+    if method == "DELETE":
+        for agent in agents:
+            api_call("DELETE", "{0}/systems/{1}/agents/{2}".format(api_url, system_id, agent['id']), headers=headers, verify=module.params['api_connection']['tls_verify'],
+                     module=module, fail_msg="Failed to unassign agent '{0}' from system".format(agent['hostname']))
+        return
+
+    def send(agent):
+        return api_call("POST", "{0}/systems/{1}/agents".format(api_url, system_id), headers=headers, json={'id': agent['id']}, verify=module.params['api_connection']['tls_verify'])
+
+    for agent, (result, error) in zip(agents, run_concurrently(send, agents, module.params['api_connection']['max_concurrency'])):
+        if error:
+            module.fail_json(msg="Failed to assign agent '{0}' to system: {1}".format(agent['hostname'], str(error)))
+
+
+def argument_spec():
+    """Return the argument spec of the module, also used by the action plugin of the same name"""
+    return dict(
+        name=dict(type='str', required=True),
+        new_name=dict(type='str', required=False),
+        description=dict(type='str', required=False),
+        magic_number=dict(type='int', required=False, choices=list(range(0, 60))),
+        checks_disabled=dict(type='bool', required=False),
+        group_id=dict(type='int', required=False),
+        group_name=dict(type='str', required=False),
+        rfc_connection=dict(
+            type='dict',
+            required=False,
+            options=dict(
+                type=dict(type='str', required=False, choices=["none", "instance", "messageServer"]),
+                host=dict(type='str', required=False),
+                instance_number=dict(type='int', required=False, choices=list(range(0, 100))),
+                sid=dict(type='str', required=False),
+                logon_group=dict(type='str', required=False),
+                username=dict(type='str', required=False, no_log=True),
+                password=dict(type='str', required=False, no_log=True),
+                client=dict(type='str', required=False),
+                sap_router_string=dict(type='str', required=False),
+                snc_enabled=dict(type='bool', required=False),
+            )
+        ),
+        agents=dict(
+            type='list',
+            elements='dict',
+            required=False,
+            options=dict(
+                name=dict(type='str', required=True)
+            )
+        ),
+        variables=dict(
+            type='list',
+            elements='dict',
+            required=False,
+            options=dict(
+                name=dict(type='str', required=True),
+                value=dict(type='raw', required=True)
+            )
         ),
-        supports_check_mode=True,
+        variables_mode=dict(type='str', required=False, default='update', choices=['update', 'replace']),
+        state=dict(type='str', required=False, default='present', choices=['present', 'absent']),
+        api_connection=get_api_connection_argument_spec()
     )
 
-    api_url = "{0}://{1}:{2}/api".format(module.params['api_connection']['protocol'], module.params['api_connection']['host'], module.params['api_connection']['port'])
-    token = get_token(api_url, module.params['api_connection']['username'], module.params['api_connection']['password'], module.params['api_connection']['tls_verify'])
-    headers = {"Authorization": "Bearer {0}".format(token)}
+
+def run_module(module):
+    """Reconcile the desired state with the API, ends with module.exit_json or module.fail_json"""
+    api_url = get_api_url(get_api_connection(module))
+    headers = get_auth_headers(api_url, module.params['api_connection'])
 
     # Validate rfc SID against pattern
     if 'rfc_connection' not in module.params or module.params['rfc_connection'] is None:
@@ -432,23 +486,25 @@ def main():
             module.fail_json(msg="Python module 're' could not be found")
         raise
 
-    current_system = lookup_resource(api_url, headers, "systems", "name", module.params['name'], module.params['api_connection']['tls_verify'])
-    if not current_system and module.params.get('new_name', None):
-        current_system = lookup_resource(api_url, headers, "systems", "name", module.params['new_name'], module.params['api_connection']['tls_verify'])
+    # Scan the systems once for name and new_name, stopping as soon as both were found
+    systems = scan_resource(api_url, headers, "systems", "name", [module.params['name'], module.params.get('new_name', None)], module.params['api_connection']['tls_verify'],
+                            module=module, fail_msg="Failed to get systems")
+    current_system = systems.get(module.params['name']) or systems.get(module.params.get('new_name', None))
 
-    system_details = get_system_details(api_url, headers, current_system['id'], module.params['api_connection']['tls_verify']) if current_system else None
+    system_details = get_system_details(api_url, headers, current_system['id'], module.params['api_connection']['tls_verify'], module.params['api_connection']['max_concurrency']) if current_system else None
 
     if module.params['state'] == 'present':
         # Lookup group id if needed
         if module.params.get('group_name'):
-            group = lookup_resource(api_url, headers, "groups", "name", module.params['group_name'], module.params['api_connection']['tls_verify'])
+            group = scan_resource(api_url, headers, "groups", "name", [module.params['group_name']], module.params['api_connection']['tls_verify'],
+                                  module=module, fail_msg="Failed to get groups")[module.params['group_name']]
             if not group:
                 module.fail_json(msg="Group '{0}' not found.".format(module.params['group_name']))
             module.params['group_id'] = group['id']
 
         # Check if group_id is valid
         if module.params.get('group_id'):
-            group = lookup_resource(api_url, headers, "groups", "id", module.params['group_id'], module.params['api_connection']['tls_verify'])
+            group = lookup_resource_by_id(api_url, headers, "groups", module.params['group_id'], module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to get group")
             if not group:
                 module.fail_json(msg="Group with ID '{0}' not found. Please ensure group is created first.".format(module.params['group_id']))
 
@@ -494,40 +550,35 @@ def main():
 
             # Check if variable assignments need to be updated
             if 'variables' in module.params and module.params['variables'] is not None:
-                current_vars = sorted(
-                    [{"name": v['name'], "value": str(v['value'])} for v in system_details.get('variables', [])],
-                    key=lambda x: x['name']
-                )
+                # Compare name-keyed maps, the sorted lists are only built for reporting changes
+                current_vars = {v['name']: str(v['value']) for v in system_details.get('variables', [])}
 
                 if module.params['variables_mode'] == 'replace':
                     # Replace mode: use only the variables from module.params
-                    desired_vars = sorted(
-                        [{"name": v['name'], "value": str(v['value'])} for v in module.params['variables']],
-                        key=lambda x: x['name']
-                    ) if module.params.get('variables') else []
+                    desired_vars = {}
                 else:
                     # Update mode: merge current_vars with module.params['variables'], giving priority to module.params
-                    merged_vars = {var['name']: var['value'] for var in current_vars}
-
-                    if module.params.get('variables'):
-                        for var in module.params['variables']:
-                            merged_vars[var['name']] = str(var['value'])
+                    desired_vars = dict(current_vars)
 
-                    desired_vars = sorted(
-                        [{"name": name, "value": value} for name, value in merged_vars.items()],
-                        key=lambda x: x['name']
-                    )
+                for var in module.params.get('variables') or []:
+                    desired_vars[var['name']] = str(var['value'])
 
                 if desired_vars != current_vars:
                     diff['variables'] = {
-                        'current': current_vars,
-                        'desired': desired_vars
+                        'current': [{"name": name, "value": current_vars[name]} for name in sorted(current_vars)],
+                        'desired': [{"name": name, "value": desired_vars[name]} for name in sorted(desired_vars)]
                     }
 
             if diff:
                 if module.check_mode:
                     module.exit_json(changed=True, msg="System would be updated.", changes=diff)
 
+                # Ensure all desired agents and variables exist before changing anything
+                if 'agents' in diff:
+                    resolve_agents(api_url, headers, module, desired_agents, "Agent(s) {0} not found. Please ensure agent exists first.")
+                if 'variables' in diff:
+                    variable_payload = build_variable_payload(api_url, headers, module, diff['variables']['desired'])
+
                 # Update system
                 if 'general' in diff:
                     current_system = api_call(method="PUT", url="{0}/systems/{1}".format(api_url, system_details['general']['id']), headers=headers, json=system_payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to update system.").json()
@@ -543,38 +594,31 @@ def main():
                     #         api_call(method="DELETE", url="{0}/systems/{1}/agents/{2}".format(api_url, current_system['id'], agent['id']), headers=headers, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to unassign agent from system.")
 
                     # Try to unassign agents as long as needed. Workaround for #0004 ----
+                    # Start with the agents fetched by get_system_details and only fetch them again after unassigning
+                    current_agents = system_details['agents']
                     while True:
-                        # Get currently assigned agents
-                        current_agents = api_call("GET", "{0}/systems/{1}/agents".format(api_url, current_system['id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
-
-                        # Filter agents that should be unassigned
-                        agents_to_remove = [agent for agent in current_agents if agent['name'] not in desired_agents]
+                        # Agents that should be unassigned
+                        agents_to_remove = sorted(set(agent['name'] for agent in current_agents) - set(desired_agents))
 
                         # Break if there's nothing to remove
                         if not agents_to_remove:
                             break
 
                         # Unassign agents
-                        for agent in agents_to_remove:
-                            api_agent = lookup_resource(api_url, headers, "agents", "hostname", agent['name'], module.params['api_connection']['tls_verify'])
-                            if not api_agent:
-                                module.fail_json(msg="Agent '{0}' not found. Please ensure agent exists.".format(agent['name']))
-                            api_call(method="DELETE", url="{0}/systems/{1}/agents/{2}".format(api_url, current_system['id'], api_agent['id']), headers=headers, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to unassign agent from system.")
+                        change_agent_assignments(api_url, headers, module, current_system['id'], "DELETE",
+                                                 resolve_agents(api_url, headers, module, agents_to_remove, "Agent(s) {0} not found. Please ensure agent exists."))
+
+                        # Get currently assigned agents
+                        current_agents = api_call("GET", "{0}/systems/{1}/agents".format(api_url, current_system['id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
                     # End of workaround for #0004 ---------------------------------------
 
-                    # Assign agents
-                    if module.params.get('agents'):
-                        for agent in module.params.get('agents', []) or []:
-                            if agent not in current_agents:
-                                # Assign desired agent
-                                api_agent = lookup_resource(api_url, headers, "agents", "hostname", agent['name'], module.params['api_connection']['tls_verify'])
-                                if not api_agent:
-                                    module.fail_json(msg="Agent '{0}' not found. Please ensure agent exists first.".format(agent['name']))
-                                api_call(method="POST", url="{0}/systems/{1}/agents".format(api_url, current_system['id']), headers=headers, json={'id': api_agent['id']}, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to assign agent to system.")
+                    # Assign agents that are not assigned yet
+                    agents_to_add = sorted(set(desired_agents) - set(agent['name'] for agent in current_agents))
+                    change_agent_assignments(api_url, headers, module, current_system['id'], "POST",
+                                             resolve_agents(api_url, headers, module, agents_to_add, "Agent(s) {0} not found. Please ensure agent exists first."))
 
                 # Update variables
                 if 'variables' in diff:
-                    variable_payload = build_variable_payload(api_url, headers, module, desired_vars)
                     api_call(method="POST", url="{0}/systems/{1}/variables".format(api_url, current_system['id']), headers=headers, json=variable_payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to assign variables to system.")
 
                 module.exit_json(changed=True, msg="System updated.", api_response=current_system, changes=diff)
@@ -585,20 +629,18 @@ def main():
             if module.check_mode:
                 module.exit_json(changed=True, msg="System would be created.")
 
+            # Ensure all desired agents and variables exist before creating the system
+            agents_to_add = resolve_agents(api_url, headers, module, sorted(set(agent['name'] for agent in module.params.get('agents') or [] if 'name' in agent)),
+                                           "Agent(s) {0} not found. Please ensure agent exists first.")
+            variable_payload = build_variable_payload(api_url, headers, module, module.params.get('variables'))
+
             # Create system
             current_system = api_call(method="POST", url="{0}/systems".format(api_url), headers=headers, json=system_payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to create system.").json()
 
             # Assign agents
-            if module.params.get('agents'):
-                for agent in module.params.get('agents', []) or []:
-                    # Assign desired agent
-                    api_agent = lookup_resource(api_url, headers, "agents", "hostname", agent['name'], module.params['api_connection']['tls_verify'])
-                    if not api_agent:
-                        module.fail_json(msg="Agent '{0}' not found. Please ensure agent exists first.".format(agent['name']))
-                    api_call(method="POST", url="{0}/systems/{1}/agents".format(api_url, current_system['id']), headers=headers, json={'id': api_agent['id']}, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to assign agent to system.")
+            change_agent_assignments(api_url, headers, module, current_system['id'], "POST", agents_to_add)
 
             # Assign variables
-            variable_payload = build_variable_payload(api_url, headers, module, module.params.get('variables'))
             api_call(method="POST", url="{0}/systems/{1}/variables".format(api_url, current_system['id']), headers=headers, json=variable_payload, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to assign variables to system.")
 
             module.exit_json(changed=True, msg="System created.", api_response=current_system)
@@ -618,17 +660,16 @@ def main():
         #     api_call(method="DELETE", url="{0}/systems/{1}/agents/{2}".format(api_url, current_system['id'], agent['id']), headers=headers, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to unassign agent from system")
 
         # Try to unassign agents as long as needed. Workaround for #0004 ----
+        # Start with the agents fetched by get_system_details and only fetch them again after unassigning
+        agents = system_details['agents']
         while True:
-            agents = api_call("GET", "{0}/systems/{1}/agents".format(api_url, current_system['id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
-
             if not agents:
                 break
 
-            for system_agent in agents:
-                agent = lookup_resource(api_url, headers, "agents", "hostname", system_agent['name'], module.params['api_connection']['tls_verify'])
-                if not agent:
-                    module.fail_json(msg="Agent '{0}' not found. Please ensure agent exists.".format(system_agent['name']))
-                api_call(method="DELETE", url="{0}/systems/{1}/agents/{2}".format(api_url, current_system['id'], agent['id']), headers=headers, verify=module.params['api_connection']['tls_verify'], module=module, fail_msg="Failed to unassign agent from system")
+            change_agent_assignments(api_url, headers, module, current_system['id'], "DELETE",
+                                     resolve_agents(api_url, headers, module, sorted(set(system_agent['name'] for system_agent in agents)), "Agent(s) {0} not found. Please ensure agent exists."))
+
+            agents = api_call("GET", "{0}/systems/{1}/agents".format(api_url, current_system['id']), headers=headers, verify=module.params['api_connection']['tls_verify']).json()
         # End of workaround for #0004 ---------------------------------------
 
         # Unassign all variables
@@ -642,5 +683,10 @@ def main():
     module.exit_json(changed=True, msg="System state processed.")
 
 
+def main():
+    module = AnsibleModule(argument_spec=argument_spec(), supports_check_mode=True)
+    run_module(module)
+
+
 if __name__ == '__main__':
     main()
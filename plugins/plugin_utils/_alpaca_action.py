@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+
+# This module is for internal use only within the pcg.alpaca_operator collection.
+# Python versions supported: 3.8+
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import traceback
+
+from ansible.module_utils.common.parameters import remove_values
+from ansible.plugins.action import ActionBase
+from ansible.utils.vars import merge_hash
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils._alpaca_api import reset_run_state
+
+
+class _ModuleExit(BaseException):
+    """Ends a module run on the controller, derived from BaseException like SystemExit so 'except Exception' does not catch it"""
+
+    def __init__(self, result):
+        super(_ModuleExit, self).__init__()
+        self.result = result
+
+
+class ControllerModule(object):
+    """Stand-in for AnsibleModule that runs the logic of a module in the controller process"""
+
+    def __init__(self, params, check_mode, socket_path=None):
+        self.params = params
+        self.check_mode = check_mode
+        self._socket_path = socket_path
+
+    def exit_json(self, **kwargs):
+        raise _ModuleExit(kwargs)
+
+    def fail_json(self, msg, **kwargs):
+        kwargs.update(failed=True, msg=msg)
+        raise _ModuleExit(kwargs)
+
+
+class AlpacaModuleAction(ActionBase):
+    """
+    Run a module of this collection inside the controller process if the task runs on the controller, e.g. with
+    delegate_to: localhost, or uses the pcg.alpaca_operator.alpaca httpapi connection. This skips packaging the module with
+    AnsiballZ and starting a new Python interpreter. Tasks on other hosts, with become, async or a task environment run the
+    module on the target host as usual.
+
+    Subclasses set MODULE to the module, which provides argument_spec() and run_module(module).
+    """
+
+    _supports_check_mode = True
+    _supports_async = True
+
+    MODULE = None
+
+    def _socket_path(self):
+        """Return the socket of the persistent httpapi connection of the task, or None"""
+        if not self._connection.transport.endswith('httpapi'):
+            return None
+        return getattr(self._connection, 'socket_path', None)
+
+    def _runs_on_controller(self):
+        return ((self._connection.transport == 'local' or self._socket_path()) and not self._play_context.become
+                and not self._task.async_val and not any(self._task.environment or []))
+
+    def run(self, tmp=None, task_vars=None):
+        result = super(AlpacaModuleAction, self).run(tmp, task_vars)
+        del tmp  # tmp no longer has any effect
+
+        if not self._runs_on_controller():
+            wrap_async = self._task.async_val and not self._connection.has_native_async
+            result = merge_hash(result, self._execute_module(task_vars=task_vars, wrap_async=wrap_async))
+            if not wrap_async:
+                self._remove_tmp_path(self._connection._shell.tmpdir)
+            return result
+
+        validation_result, params = self.validate_argument_spec(argument_spec=self.MODULE.argument_spec())
+        # The controller process runs every task and loop item, start and end each run without state of another one
+        reset_run_state()
+        try:
+            self.MODULE.run_module(ControllerModule(params, self._play_context.check_mode, self._socket_path()))
+            module_result = {}
+        except _ModuleExit as e:
+            module_result = e.result
+        except Exception as e:
+            module_result = dict(failed=True, msg="Module failed on the controller: {0}".format(str(e)), exception=traceback.format_exc())
+        finally:
+            reset_run_state()
+
+        module_result['invocation'] = dict(module_args=params)
+        result.update(remove_values(module_result, validation_result._no_log_values))
+        return result
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import io
+import json
+
+import pytest
+
+from ansible.module_utils.common.arg_spec import ArgumentSpecValidator
+from ansible.module_utils.six.moves.urllib.parse import urlsplit
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils import _alpaca_api
+from ansible_collections.pcg.alpaca_operator.plugins.plugin_utils._alpaca_action import ControllerModule, _ModuleExit
+
+API_CONNECTION = dict(host='alpaca', port=8443, protocol='https', username='user', password='secret')
+
+# Module run state of _alpaca_api, replaced by empty containers for every test
+RUN_STATE = ['_idle_connections', '_logins', '_renewed_tokens', '_resource_indexes', '_resource_items', '_response_caches',
+             '_snapshot_stores', '_local_proxies', '_persistent_connections', '_flights', '_dedup_windows']
+
+
+class FakeResponse(io.BytesIO):
+    headers = {}
+
+
+class FakeApi(object):
+    """
+    ALPACA Operator API answering the requests of a module run from registered responses.
+
+    Every request is recorded as (method, path). Writes without a registered response answer with the sent body,
+    DELETE requests with 204 No Content.
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.responses = {('POST', '/api/auth/login'): (200, {'token': 'token'})}
+
+    def add(self, method, path, body, status=200):
+        self.responses[(method, path)] = (status, body)
+
+    def writes(self):
+        return [request for request in self.requests if request[0] != 'GET' and request[1] != '/api/auth/login']
+
+    def open_response(self, method, url, headers, data, verify):
+        path = urlsplit(url).path
+        self.requests.append((method, path))
+        if (method, path) in self.responses:
+            status_code, body = self.responses[(method, path)]
+        elif method == 'GET':
+            status_code, body = 404, {'error': 'not found'}
+        elif method == 'DELETE':
+            status_code, body = 204, None
+        else:
+            status_code, body = 200, json.loads(data) if data else {}
+        content = json.dumps(body).encode('utf-8') if body is not None else b''
+        return status_code, FakeResponse(content), lambda complete: None
+
+
+@pytest.fixture
+def api(monkeypatch):
+    for name in RUN_STATE:
+        monkeypatch.setattr(_alpaca_api, name, {})
+    fake_api = FakeApi()
+    monkeypatch.setattr(_alpaca_api, '_open_response', fake_api.open_response)
+    return fake_api
+
+
+@pytest.fixture
+def run_module(api):
+    """Return a function running the module logic against the fake API, like the action plugin does on the controller"""
+    return _run_module
+
+
+def _run_module(module, params, check_mode=False):
+    result = ArgumentSpecValidator(module.argument_spec()).validate(dict(params, api_connection=dict(API_CONNECTION)))
+    assert not result.error_messages
+    try:
+        module.run_module(ControllerModule(result.validated_parameters, check_mode))
+    except _ModuleExit as e:
+        return e.result
+    raise AssertionError("Module did not exit")
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import io
+import threading
+
+import pytest
+
+from ansible.module_utils.six.moves import http_client
+from ansible_collections.pcg.alpaca_operator.plugins.module_utils import _alpaca_api
+
+
+class FakeResponse(object):
+    status = 200
+    will_close = False
+
+
+class FakeConnection(object):
+    """Keep-alive connection whose server drops the connection after receiving the request"""
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def request(self, method, path, body=None, headers=None):
+        self.requests.append((method, path))
+
+    def getresponse(self):
+        if len(self.requests) == 1:
+            raise http_client.RemoteDisconnected("Remote end closed connection without response")
+        return FakeResponse()
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    sent = []
+    monkeypatch.setattr(_alpaca_api, '_acquire_connection', lambda key: (FakeConnection(sent), True))
+    monkeypatch.setattr(_alpaca_api, '_release_connection', lambda key, connection: None)
+    return sent
+
+
+@pytest.mark.parametrize('method', ['GET', 'PUT', 'DELETE'])
+def test_idempotent_request_is_retried_on_dropped_connection(requests, method):
+    status_code, response, done = _alpaca_api._open_response(method, 'http://alpaca:8443/api/agents/1', {}, None, True)
+    done(True)
+    assert status_code == 200
+    assert requests == [(method, '/api/agents/1')] * 2
+
+
+def test_post_is_not_sent_again_on_dropped_connection(requests):
+    with pytest.raises(http_client.RemoteDisconnected):
+        _alpaca_api._open_response('POST', 'http://alpaca:8443/api/agents', {}, b'{}', True)
+    assert requests == [('POST', '/api/agents')]
+
+
+class RedirectResponse(object):
+    will_close = False
+
+    def __init__(self, status, location=None):
+        self.status = status
+        self.location = location
+
+    def getheader(self, name):
+        return self.location if name == 'Location' else None
+
+    def read(self):
+        return b''
+
+
+class RedirectConnection(object):
+    """Keep-alive connection of a server that moved /api/agents to /api/v2/agents"""
+
+    def __init__(self, requests):
+        self.requests = requests
+
+    def request(self, method, path, body=None, headers=None):
+        self.requests.append((method, path))
+
+    def getresponse(self):
+        if self.requests[-1][1] == '/api/agents':
+            return RedirectResponse(301, '/api/v2/agents')
+        return RedirectResponse(200)
+
+    def close(self):
+        pass
+
+
+@pytest.mark.parametrize('method, requests', [
+    ('GET', [('GET', '/api/agents'), ('GET', '/api/v2/agents')]),
+    ('POST', [('POST', '/api/agents')]),
+])
+def test_only_get_and_head_follow_redirects(monkeypatch, method, requests):
+    sent = []
+    monkeypatch.setattr(_alpaca_api, '_acquire_connection', lambda key: (RedirectConnection(sent), False))
+    monkeypatch.setattr(_alpaca_api, '_release_connection', lambda key, connection: None)
+    status_code, response, done = _alpaca_api._open_response(method, 'http://alpaca:8443/api/agents', {}, None, True)
+    assert status_code == (200 if method == 'GET' else 301)
+    assert sent == requests
+
+
+class FailJson(Exception):
+    pass
+
+
+class FakeModule(object):
+    def fail_json(self, **kwargs):
+        raise FailJson(kwargs)
+
+
+class FakeBody(object):
+    headers = {}
+
+    def __init__(self, content):
+        self.content = content
+
+    def read(self, size=None):
+        content, self.content = self.content, b''
+        return content
+
+
+def test_scan_resource_fails_module_when_token_is_rejected(monkeypatch):
+    monkeypatch.setattr(_alpaca_api, '_open_response', lambda method, url, headers, data, verify: (401, FakeBody(b'unauthorized'), lambda complete: None))
+    with pytest.raises(FailJson) as e:
+        _alpaca_api.scan_resource('http://alpaca:8443/api', {'Authorization': 'Bearer rejected'}, 'groups', 'name', ['g1'], True,
+                                  module=FakeModule(), fail_msg="Failed to get groups")
+    assert e.value.args[0]['msg'] == "Failed to get groups: HTTP 401: unauthorized"
+
+
+class KeepAliveBody(io.BytesIO):
+    headers = {}
+    will_close = False
+
+
+@pytest.mark.parametrize('drain_limit, reused', [(1024 * 1024, True), (10, False)])
+def test_scan_resource_reads_the_rest_of_a_small_collection(monkeypatch, drain_limit, reused):
+    body = KeepAliveBody(('[{"id": 1, "name": "g1"}' + ', {"id": 2, "name": "other"}' * 10000 + ']').encode('utf-8'))
+    completed = []
+    monkeypatch.setattr(_alpaca_api, 'SCAN_DRAIN_LIMIT', drain_limit)
+    monkeypatch.setattr(_alpaca_api, '_resource_indexes', {})
+    monkeypatch.setattr(_alpaca_api, '_open_response', lambda method, url, headers, data, verify: (200, body, completed.append))
+    found = _alpaca_api.scan_resource('http://alpaca:8443/api', {}, 'groups', 'name', ['g1'], True, module=FakeModule())
+    assert found['g1'] == {'id': 1, 'name': 'g1'}
+    assert completed == [reused]
+
+
+@pytest.mark.skipif(not (_alpaca_api.HAS_SQLITE3 and _alpaca_api.HAS_FCNTL), reason="requires sqlite3 and fcntl")
+def test_snapshot_fill_does_not_block_other_collections(tmp_path):
+    store = _alpaca_api.SnapshotStore(str(tmp_path / 'snapshots.sqlite'), 60)
+    downloading = threading.Event()
+    release = threading.Event()
+
+    def fetch_agents():
+        downloading.set()
+        release.wait(10)
+        return [{'id': 1, 'hostname': 'agent01'}]
+
+    results = {}
+    agents = threading.Thread(target=lambda: results.update(agents=store.index('http://alpaca/api/agents', _alpaca_api.ResourceIndex, fetch_agents)))
+    groups = threading.Thread(target=lambda: results.update(groups=store.index('http://alpaca/api/groups', _alpaca_api.ResourceIndex,
+                                                                               lambda: [{'id': 1, 'name': 'prod'}])))
+    agents.start()
+    try:
+        assert downloading.wait(10)
+        groups.start()
+        groups.join(5)
+        assert 'groups' in results and 'agents' not in results
+    finally:
+        release.set()
+        agents.join()
+        groups.join()
+    assert results['groups'].get('name', 'prod') == {'id': 1, 'name': 'prod'}
+    assert results['agents'].get('hostname', 'agent01') == {'id': 1, 'hostname': 'agent01'}
+
+
+def test_dedup_window_keeps_only_the_parsed_response(monkeypatch):
+    url = 'http://alpaca:8443/api/agents'
+    sent = []
+
+    def open_response(method, url, headers, data, verify):
+        sent.append((method, url))
+        return 200, FakeBody(b'[{"id": 1, "hostname": "agent01"}]'), lambda complete: None
+
+    monkeypatch.setattr(_alpaca_api, '_flights', {})
+    monkeypatch.setattr(_alpaca_api, '_dedup_windows', {'http://alpaca:8443/api': 5})
+    monkeypatch.setattr(_alpaca_api, '_open_response', open_response)
+
+    first = _alpaca_api.api_call('GET', url)
+    assert first.json() == [{'id': 1, 'hostname': 'agent01'}]
+    flight = _alpaca_api._flights[(url, None)]
+    assert flight.result._content is None
+
+    second = _alpaca_api.api_call('GET', url)
+    assert sent == [('GET', url)]
+    assert second.json() == first.json()
+    assert second.json() is not first.json()
+
+
+def test_dedup_window_hides_changes_of_the_first_caller(monkeypatch):
+    url = 'http://alpaca:8443/api/agents'
+    monkeypatch.setattr(_alpaca_api, '_flights', {})
+    monkeypatch.setattr(_alpaca_api, '_dedup_windows', {'http://alpaca:8443/api': 5})
+    monkeypatch.setattr(_alpaca_api, '_open_response', lambda method, url, headers, data, verify: (200, FakeBody(b'[{"id": 1}]'), lambda complete: None))
+
+    first = _alpaca_api.api_call('GET', url)
+    first.json()[0]['hostname'] = 'changed'
+    first.json().append({'id': 2})
+
+    assert _alpaca_api.api_call('GET', url).json() == [{'id': 1}]
+
+
+def test_response_cache_ttl_of_zero_is_kept(monkeypatch, tmp_path):
+    monkeypatch.setattr(_alpaca_api, '_response_caches', {})
+    _alpaca_api._register_response_cache('http://alpaca:8443/api', dict(response_cache=True, response_cache_dir=str(tmp_path), response_cache_ttl=0))
+    assert _alpaca_api._response_caches['http://alpaca:8443/api'].ttl == 0
+
+
+def test_negative_cache_ttl_is_rejected():
+    assert _alpaca_api.get_negative_options(dict(response_cache_ttl=-1)) == ['response_cache_ttl']
+    assert _alpaca_api.get_negative_options(dict(response_cache_ttl=0)) == []
+
+
+@pytest.mark.skipif(not _alpaca_api.HAS_SQLITE3, reason="requires sqlite3")
+def test_snapshot_cache_ttl_of_zero_is_kept(monkeypatch, tmp_path):
+    monkeypatch.setattr(_alpaca_api, '_snapshot_stores', {})
+    _alpaca_api._register_snapshot_store('http://alpaca:8443/api', dict(snapshot_cache=True, snapshot_cache_path=str(tmp_path / 'snapshots.sqlite'),
+                                                                        snapshot_cache_ttl=0))
+    assert _alpaca_api._snapshot_stores['http://alpaca:8443/api'].ttl == 0
+    assert _alpaca_api.get_negative_options(dict(snapshot_cache_ttl=-1)) == ['snapshot_cache_ttl']
+
+
+def test_token_cache_ttl_of_zero_does_not_reuse_tokens_without_expiry(monkeypatch, tmp_path):
+    logins = []
+    monkeypatch.setattr(_alpaca_api, '_login', lambda api_url, username, password, verify: logins.append(username) or 'token')
+    cache_file = str(tmp_path / 'token.json')
+    _alpaca_api._cached_login('http://alpaca:8443/api', 'user', 'secret', True, cache_file, 0)
+    _alpaca_api._cached_login('http://alpaca:8443/api', 'user', 'secret', True, cache_file, 0)
+    assert logins == ['user', 'user']
+    assert _alpaca_api.get_negative_options(dict(token_cache_ttl=-1)) == ['token_cache_ttl']
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules import alpaca_agent
+
+LOGIN = ('POST', '/api/auth/login')
+SCAN = ('GET', '/api/agents')
+AGENT = dict(id=2, hostname='agent02', description='db', ipAddress='10.0.0.2', location='virtual', scriptGroupId=-1,
+             escalation=dict(failuresBeforeReport=0, mailEnabled=False, mailAddress='', smsEnabled=False, smsAddress=''))
+
+
+@pytest.fixture
+def agents(api):
+    api.add('GET', '/api/agents', [{'id': 1, 'hostname': 'agent01'}, {'id': 2, 'hostname': 'agent02'}])
+    api.add('GET', '/api/agents/2', AGENT)
+    return api
+
+
+def test_create(agents, run_module):
+    result = run_module(alpaca_agent, dict(name='agent03', ip_address='10.0.0.3'))
+    assert result['changed'] and result['msg'] == "Agent created"
+    assert agents.requests == [LOGIN, SCAN, ('POST', '/api/agents')]
+
+
+def test_noop(agents, run_module):
+    result = run_module(alpaca_agent, dict(name='agent02', description='db', ip_address='10.0.0.2'))
+    assert not result['changed']
+    assert agents.requests == [LOGIN, SCAN, ('GET', '/api/agents/2')]
+
+
+def test_rename(agents, run_module):
+    result = run_module(alpaca_agent, dict(name='agent02', new_name='agent20'))
+    assert result['changed'] and result['changes'] == {'hostname': {'current': 'agent02', 'desired': 'agent20'}}
+    assert agents.requests == [LOGIN, SCAN, ('GET', '/api/agents/2'), ('PUT', '/api/agents/2')]
+
+
+def test_rename_already_done_scans_name_and_new_name_once(agents, run_module):
+    result = run_module(alpaca_agent, dict(name='agent20', new_name='agent02'))
+    assert not result['changed']
+    assert agents.requests == [LOGIN, SCAN, ('GET', '/api/agents/2')]
+
+
+def test_delete(agents, run_module):
+    result = run_module(alpaca_agent, dict(name='agent02', state='absent'))
+    assert result['changed'] and result['msg'] == "Agent deleted"
+    assert agents.requests == [LOGIN, SCAN, ('GET', '/api/agents/2'), ('DELETE', '/api/agents/2')]
+
+
+def test_delete_absent(agents, run_module):
+    result = run_module(alpaca_agent, dict(name='agent03', state='absent'))
+    assert not result['changed']
+    assert agents.requests == [LOGIN, SCAN]
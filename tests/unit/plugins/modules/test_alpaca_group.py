@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules import alpaca_group
+
+LOGIN = ('POST', '/api/auth/login')
+SCAN = ('GET', '/api/groups')
+
+
+@pytest.fixture
+def groups(api):
+    api.add('GET', '/api/groups', [{'id': 1, 'name': 'other'}, {'id': 2, 'name': 'prod'}])
+    api.add('POST', '/api/groups', {'id': 3, 'name': 'test'})
+    return api
+
+
+def test_create(groups, run_module):
+    result = run_module(alpaca_group, dict(name='test'))
+    assert result['changed'] and result['id'] == 3
+    assert groups.requests == [LOGIN, SCAN, ('POST', '/api/groups')]
+
+
+def test_noop(groups, run_module):
+    result = run_module(alpaca_group, dict(name='prod'))
+    assert not result['changed']
+    assert groups.requests == [LOGIN, SCAN]
+
+
+def test_rename(groups, run_module):
+    result = run_module(alpaca_group, dict(name='prod', new_name='production'))
+    assert result['changed'] and result['msg'] == "Group renamed"
+    assert groups.requests == [LOGIN, SCAN, ('PUT', '/api/groups/2')]
+
+
+def test_rename_already_done_scans_name_and_new_name_once(groups, run_module):
+    result = run_module(alpaca_group, dict(name='old', new_name='prod'))
+    assert not result['changed']
+    assert groups.requests == [LOGIN, SCAN]
+
+
+def test_delete(groups, run_module):
+    result = run_module(alpaca_group, dict(name='prod', state='absent'))
+    assert result['changed'] and result['msg'] == "Group deleted"
+    assert groups.requests == [LOGIN, SCAN, ('DELETE', '/api/groups/2')]
+
+
+def test_delete_absent(groups, run_module):
+    result = run_module(alpaca_group, dict(name='test', state='absent'))
+    assert not result['changed']
+    assert groups.requests == [LOGIN, SCAN]
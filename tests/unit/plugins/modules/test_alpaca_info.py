@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import os
+
+import pytest
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules import alpaca_info
+
+
+@pytest.fixture
+def groups(api):
+    api.add('GET', '/api/groups', [{'id': 1, 'name': 'prod'}])
+    return api
+
+
+@pytest.mark.parametrize('compression', [True, False])
+def test_output_path_reports_changed_content(groups, run_module, tmp_path, compression):
+    params = dict(resources=['groups'], output_path=str(tmp_path / 'snapshot.jsonl'), output_compression=compression)
+    assert run_module(alpaca_info, params)['changed']
+    assert not run_module(alpaca_info, params)['changed']
+
+    groups.add('GET', '/api/groups', [{'id': 1, 'name': 'prod'}, {'id': 2, 'name': 'test'}])
+    assert run_module(alpaca_info, params)['changed']
+    assert os.listdir(str(tmp_path)) == ['snapshot.jsonl']
+
+
+def test_output_path_is_not_written_in_check_mode(groups, run_module, tmp_path):
+    params = dict(resources=['groups'], output_path=str(tmp_path / 'snapshot.jsonl.gz'))
+    assert run_module(alpaca_info, params, check_mode=True)['changed']
+    assert os.listdir(str(tmp_path)) == []
+
+    run_module(alpaca_info, params)
+    assert not run_module(alpaca_info, params, check_mode=True)['changed']
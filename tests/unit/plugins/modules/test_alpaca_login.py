@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules import alpaca_login
+
+
+def test_token_is_not_returned_by_default(api, run_module):
+    result = run_module(alpaca_login, dict())
+    assert 'token' not in result
+    assert api.requests == [('POST', '/api/auth/login')]
+
+
+def test_token_is_returned_on_request(api, run_module):
+    result = run_module(alpaca_login, dict(return_token=True))
+    assert result['token'] == 'token'
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+import pytest
+
+from ansible_collections.pcg.alpaca_operator.plugins.modules import alpaca_system
+
+
+@pytest.fixture
+def catalogues(api):
+    api.add('GET', '/api/systems', [{'id': 1, 'name': 'SYS'}])
+    api.add('GET', '/api/systems/1', {'id': 1, 'name': 'SYS', 'description': 'old'})
+    api.add('GET', '/api/systems/1/agents', [{'id': 1, 'name': 'agent01'}])
+    api.add('GET', '/api/systems/1/variables', [{'name': 'VAR1', 'value': 'a'}])
+    api.add('GET', '/api/agents', [{'id': 1, 'hostname': 'agent01'}, {'id': 2, 'hostname': 'agent02'}])
+    api.add('GET', '/api/variables', [{'id': 1, 'name': 'VAR1'}])
+    return api
+
+
+@pytest.mark.parametrize('name', ['SYS', 'NEW'])
+def test_no_write_is_sent_when_a_variable_is_missing(catalogues, run_module, name):
+    result = run_module(alpaca_system, dict(name=name, description='new', agents=[{'name': 'agent02'}],
+                                            variables=[{'name': 'VAR1', 'value': 'b'}, {'name': 'VAR2', 'value': 'c'}]))
+    assert result['failed']
+    assert result['missing_variables'] == ['VAR2']
+    assert catalogues.writes() == []
+
+
+@pytest.mark.parametrize('name', ['SYS', 'NEW'])
+def test_no_write_is_sent_when_an_agent_is_missing(catalogues, run_module, name):
+    result = run_module(alpaca_system, dict(name=name, description='new', agents=[{'name': 'agent03'}]))
+    assert result['failed']
+    assert 'agent03' in result['msg']
+    assert catalogues.writes() == []
+
+
+def test_update_sends_writes_after_validation(catalogues, run_module):
+    catalogues.add('PUT', '/api/systems/1', {'id': 1, 'name': 'SYS', 'description': 'new'})
+    result = run_module(alpaca_system, dict(name='SYS', description='new', agents=[{'name': 'agent01'}], variables=[{'name': 'VAR1', 'value': 'b'}]))
+    assert result['changed']
+    assert catalogues.writes() == [('PUT', '/api/systems/1'), ('POST', '/api/systems/1/variables')]
+
+
+def test_agents_are_unassigned_one_after_another(catalogues, run_module):
+    catalogues.add('GET', '/api/systems/1/agents', [{'id': 1, 'name': 'agent01'}, {'id': 2, 'name': 'agent02'}])
+    catalogues.add('DELETE', '/api/systems/1/agents/1', {'error': 'locked'}, status=500)
+    result = run_module(alpaca_system, dict(name='SYS', state='absent'))
+    assert result['failed']
+    assert result['msg'].startswith("Failed to unassign agent 'agent01' from system")
+    assert catalogues.writes() == [('DELETE', '/api/systems/1/agents/1')]
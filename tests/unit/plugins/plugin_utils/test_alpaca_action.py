@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+# Copyright: Contributors to the Ansible project
+# Apache License, Version 2.0 (see LICENSE or https://www.apache.org/licenses/LICENSE-2.0)
+
+from __future__ import (absolute_import, division, print_function)
+
+__metaclass__ = type
+
+from unittest.mock import MagicMock
+
+from ansible_collections.pcg.alpaca_operator.plugins.action.alpaca_agents import ActionModule
+from ansible_collections.pcg.alpaca_operator.tests.unit.plugins.conftest import API_CONNECTION
+
+
+def run_task(args):
+    """Run an alpaca_agents task on the controller like the task executor does"""
+    task = MagicMock(args=dict(args, api_connection=dict(API_CONNECTION)), async_val=0, environment=[], check_mode=False)
+    connection = MagicMock(transport='local')
+    play_context = MagicMock(become=False, check_mode=False)
+    return ActionModule(task, connection, play_context, loader=None, templar=None, shared_loader_obj=None).run(task_vars={})
+
+
+def test_tasks_do_not_share_run_state(api):
+    api.add('GET', '/api/agents', [])
+    assert not run_task(dict(agents=[dict(name='agent01', state='absent')]))['changed']
+
+    # The agent is created outside of Ansible before the next task
+    api.add('GET', '/api/agents', [{'id': 1, 'hostname': 'agent01'}])
+    api.add('GET', '/api/agents/1', {'id': 1, 'hostname': 'agent01'})
+    assert run_task(dict(agents=[dict(name='agent01', state='absent')]))['changed']
+    assert api.writes() == [('DELETE', '/api/agents/1')]